@@ -0,0 +1,41 @@
+import os
+import tomllib
+from functools import lru_cache
+
+
+def load_settings(path: str) -> dict:
+    """Load a TOML settings file.
+
+    The parsed settings are cached until the file is modified.
+
+    Parameters
+    ----------
+    path : str
+        Path to the settings file.
+
+    Returns
+    -------
+    dict
+        The settings.
+    """
+    return _load_toml(os.path.abspath(path), os.path.getmtime(path))
+
+
+@lru_cache(maxsize=4)
+def _load_toml(path: str, mtime: float) -> dict:
+    """Parse a TOML file.
+
+    Parameters
+    ----------
+    path : str
+        Absolute path to the file.
+    mtime : float
+        Modification time of the file, part of the cache key.
+
+    Returns
+    -------
+    dict
+        The parsed file.
+    """
+    with open(path, "rb") as file:
+        return tomllib.load(file)
@@ -1,12 +1,70 @@
+import gc
+import hashlib
 import io
+import os
+import tempfile
+import warnings
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import Enum, auto
 from importlib import import_module
+from pathlib import Path
+from typing import Any, BinaryIO
 
 import torch
 from PIL import Image
+from torchvision.io import ImageReadMode, decode_image, decode_jpeg
+from torchvision.transforms.v2.functional import pil_to_tensor
 
+from image_signatures import JPEG_SIGNATURE, PNG_SIGNATURE
 from models import Model, ModelBase, ModelCategory
 
+# Read by the CUDA caching allocator on first use. Expandable segments keep
+# fragmentation low when models of different sizes are loaded and released.
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
+# Device the models run on, probed once for all the model wrappers.
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Decoded images shared by all the model wrappers, keyed by the digest of the
+# image bytes and the device, so an image validated and then processed is
+# decoded once. Decoded images are full size, hence the small capacity.
+_decoded_images: OrderedDict[tuple[bytes, torch.device], torch.Tensor] = OrderedDict()
+_DECODED_IMAGES_CAPACITY = 8
+# Largest batch run by TensorRT engines. Larger batches run on the model.
+_ENGINE_MAX_BATCH_SIZE = 16
+
+
+def image_digest(image: bytes) -> bytes:
+    """Get the digest identifying an image.
+
+    Parameters
+    ----------
+    image : bytes
+        The image in bytes.
+
+    Returns
+    -------
+    bytes
+        The digest of the image.
+    """
+    return hashlib.blake2b(image, digest_size=16).digest()
+
+
+class Precision(Enum):
+    """Numeric precision used to run a model.
+
+    Parameters
+    ----------
+    Enum : EnumMeta
+        Enumeration metaclass.
+    """
+
+    FP32 = auto()
+    FP16 = auto()
+    BF16 = auto()
+    INT8 = auto()
+
 
 class ModelWrapper(ABC):
     """Abstract class for model wrappers."""
@@ -14,7 +72,13 @@ class ModelWrapper(ABC):
     def __init__(
         self,
         model: Model,
-        weights: bytes,
+        weights: BinaryIO,
+        compile_model: bool = False,
+        precision: str = "fp32",
+        cuda_graph: bool = False,
+        compile_mode: str = "reduce-overhead",
+        tensorrt: bool = False,
+        engine_cache_dir: str | None = None,
     ):
         """Initialize the model.
 
@@ -22,26 +86,66 @@ class ModelWrapper(ABC):
         ----------
         model : Model
             The model dataclass instance.
-        weights : bytes
-            Weights of the model.
+        weights : BinaryIO
+            Stream of the model weights.
+        compile_model : bool, optional
+            Indicates if the model forward pass should be compiled with torch.compile, by default False.
+        precision : str, optional
+            Numeric precision, one of "fp32", "fp16" (CUDA only), "bf16" (CUDA only, mixed precision with autocast) or "int8" (CPU only, dynamic quantization of linear layers), by default "fp32".
+        cuda_graph : bool, optional
+            Indicates if the model forward pass should be captured in a CUDA graph and replayed for single image batches, by default False. Ignored without CUDA.
+        compile_mode : str, optional
+            Mode of torch.compile, by default "reduce-overhead", which also replays the compiled forward pass from CUDA graphs. Ignored if the model is not compiled.
+        tensorrt : bool, optional
+            Indicates if the model forward pass should be replaced with a TensorRT engine, by default False. Requires torch-tensorrt and CUDA. The model is neither compiled nor captured in a CUDA graph if the engine is built.
+        engine_cache_dir : str | None, optional
+            Directory where TensorRT engines are saved and loaded from, by default None (engines are built on every start).
+
+        Raises
+        ------
+        ValueError
+            If the precision is invalid or not supported on the available device.
         """
+        # Parsed before the model is built, so a mistyped precision fails fast.
+        try:
+            parsed_precision = Precision[precision.upper()]
+        except KeyError:
+            raise ValueError(f"Invalid precision: {precision}")
         self._model = self._get_model(model, weights)
-        if torch.cuda.is_available():
-            self._model.cuda()
-            self._device_tensor = lambda x: x.cuda()
-        else:
-            self._device_tensor = lambda x: x
         self._model.eval()
+        self._model.requires_grad_(False)
+        self._model.fuse_batch_norms()
+        self._device = DEVICE
+        # Convolutions run fastest on channels last tensors, in particular
+        # with the Tensor Core kernels of cuDNN.
+        self._model.to(self._device, memory_format=torch.channels_last)
+        self._copy_stream: torch.cuda.Stream | None = None
+        if self._device.type == "cuda":
+            torch.backends.cudnn.benchmark = True
+            self._copy_stream = torch.cuda.Stream()
+        self._input_dtype = torch.float32
+        self._autocast_dtype: torch.dtype | None = None
+        self._set_precision(parsed_precision)
+        self._graph: tuple[torch.cuda.CUDAGraph, torch.Tensor, Any] | None = None
+        engine = (
+            tensorrt
+            and self._device.type == "cuda"
+            and self._build_engine(engine_cache_dir)
+        )
+        if compile_model and not engine:
+            self._compile(compile_mode)
+        if cuda_graph and self._device.type == "cuda" and not engine:
+            self._capture_graph()
 
-    def _get_model(self, model: Model, weights: bytes) -> ModelBase:
+    def _get_model(self, model: Model, weights: BinaryIO) -> ModelBase:
         """Get the model.
 
         Parameters
         ----------
         model : Model
             The model dataclass instance.
-        weights : bytes
-            The model weights.
+        weights : BinaryIO
+            Stream of the model weights.
 
         Returns
         -------
@@ -54,13 +158,349 @@ class ModelWrapper(ABC):
         )
         return getattr(module, model.class_name)(weights)
 
+    def _set_precision(self, precision: Precision):
+        """Convert the model to a numeric precision.
+
+        Parameters
+        ----------
+        precision : Precision
+            Numeric precision.
+
+        Raises
+        ------
+        ValueError
+            If the precision is not supported on the available device.
+        """
+        cuda = self._device.type == "cuda"
+        match precision:
+            case Precision.FP32:
+                pass
+            case Precision.FP16 if cuda:
+                self._model.half()
+                self._input_dtype = torch.float16
+            case Precision.BF16 if cuda and torch.cuda.is_bf16_supported():
+                # Autocast keeps numerically sensitive operations, such as
+                # the softmax layers, in float32.
+                self._autocast_dtype = torch.bfloat16
+            case Precision.INT8 if not cuda:
+                self._model = torch.ao.quantization.quantize_dynamic(
+                    self._model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+            case _:
+                device = "CUDA" if cuda else "CPU"
+                raise ValueError(
+                    f"Precision {precision.name} is not supported on {device}"
+                )
+
+    def _compile(self, mode: str):
+        """Compile the model forward pass.
+
+        The compiled forward pass is run a few times on a dummy batch so
+        compilation, and CUDA graph recording in the "reduce-overhead" mode,
+        happen at load time. If compilation fails, the model keeps running in
+        eager mode.
+
+        Parameters
+        ----------
+        mode : str
+            Mode of torch.compile.
+        """
+        forward = self._model.forward
+        try:
+            self._model.forward = torch.compile(forward, mode=mode)
+            dummy_batch = self._dummy_batch()
+            for _ in range(3):
+                self.forward(dummy_batch)
+        except Exception as e:
+            warnings.warn(
+                f"Could not compile {self._model.__class__.__name__}, "
+                f"running in eager mode: {e}",
+                RuntimeWarning,
+            )
+            self._model.forward = forward
+
+    def _build_engine(self, cache_dir: str | None) -> bool:
+        """Replace the model forward pass with a TensorRT engine.
+
+        The engine is built for the model input shape and batches of up to
+        ``_ENGINE_MAX_BATCH_SIZE`` images, at the input precision. Building an
+        engine takes minutes, so engines are saved to the cache directory, if
+        any, and loaded from it on later starts. If TensorRT is not installed
+        or the engine cannot be built, the model keeps running as is.
+
+        Parameters
+        ----------
+        cache_dir : str | None
+            Directory where engines are saved and loaded from.
+
+        Returns
+        -------
+        bool
+            Indicates if the forward pass was replaced.
+        """
+        forward = self._model.forward
+        try:
+            engine = self._load_engine(cache_dir)
+        except Exception as e:
+            warnings.warn(
+                f"Could not build a TensorRT engine for "
+                f"{self._model.__class__.__name__}: {e}",
+                RuntimeWarning,
+            )
+            return False
+
+        def forward_engine(batch):
+            if len(batch) > _ENGINE_MAX_BATCH_SIZE:
+                return forward(batch)
+            # Engine bindings are dense NCHW tensors.
+            return engine(batch.contiguous())
+
+        self._model.forward = forward_engine
+        return True
+
+    def _load_engine(self, cache_dir: str | None):
+        """Load the TensorRT engine of the model, building it if not cached.
+
+        Engines are specific to the weights, the precision, the TensorRT
+        version and the GPU architecture, which all make up the cache key.
+
+        Parameters
+        ----------
+        cache_dir : str | None
+            Directory where engines are saved and loaded from.
+
+        Returns
+        -------
+        torch.jit.ScriptModule
+            The engine, wrapped in a TorchScript module.
+        """
+        import torch_tensorrt
+
+        path = None
+        if cache_dir is not None:
+            major, minor = torch.cuda.get_device_capability(self._device)
+            dtype = str(self._input_dtype).removeprefix("torch.")
+            path = Path(cache_dir) / (
+                f"{self._model.weights_digest.hex()}-{dtype}-"
+                f"{_ENGINE_MAX_BATCH_SIZE}-{torch_tensorrt.__version__}-"
+                f"sm{major}{minor}.ts"
+            )
+            if path.exists():
+                return torch.jit.load(path, map_location=self._device)
+        shape = (3, *self._model.input_size)
+        engine = torch_tensorrt.compile(
+            self._model,
+            ir="ts",
+            inputs=[
+                torch_tensorrt.Input(
+                    min_shape=(1, *shape),
+                    opt_shape=(1, *shape),
+                    max_shape=(_ENGINE_MAX_BATCH_SIZE, *shape),
+                    dtype=self._input_dtype,
+                )
+            ],
+            enabled_precisions={self._input_dtype},
+        )
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as saved:
+                try:
+                    torch.jit.save(engine, saved)
+                except BaseException:
+                    os.unlink(saved.name)
+                    raise
+            os.replace(saved.name, path)
+        return engine
+
+    def _capture_graph(self):
+        """Capture the model forward pass in a CUDA graph.
+
+        The forward pass is warmed up on a side stream before capture, as
+        required by CUDA graphs. If capture fails, the model keeps running
+        without the graph.
+        """
+        static_input = self._dummy_batch()
+        try:
+            with torch.inference_mode(), self._autocast():
+                stream = torch.cuda.Stream()
+                stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(stream):
+                    for _ in range(3):
+                        self._model(static_input)
+                torch.cuda.current_stream().wait_stream(stream)
+                graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(graph):
+                    static_output = self._model(static_input)
+        except Exception as e:
+            warnings.warn(
+                f"Could not capture {self._model.__class__.__name__} "
+                f"in a CUDA graph: {e}",
+                RuntimeWarning,
+            )
+            return
+        self._graph = (graph, static_input, static_output)
+
+    def _dummy_batch(self):
+        """Get a dummy batch with the model input shape.
+
+        Returns
+        -------
+        torch.Tensor
+            A batch of one zero image on the model device, in the channels last
+            memory format of loaded batches.
+        """
+        return torch.zeros(
+            (1, 3, *self._model.input_size),
+            dtype=self._input_dtype,
+            device=self._device,
+        ).contiguous(memory_format=torch.channels_last)
+
+    def _autocast(self):
+        """Get the autocast context of the model precision.
+
+        Returns
+        -------
+        torch.autocast
+            Autocast context, disabled unless the precision is mixed.
+        """
+        return torch.autocast(
+            self._device.type,
+            dtype=self._autocast_dtype,
+            enabled=self._autocast_dtype is not None,
+        )
+
     @property
     def model(self):
         return self._model
 
+    def release(self):
+        """Release the model and return its cached GPU memory to the device.
+
+        The wrapper cannot be used after it is released.
+        """
+        self._graph = None
+        # The compiled or engine forward pass set by _compile or _build_engine
+        # refers back to the model, so it is dropped to break the cycle, and
+        # any cycle left, such as in compiled code caches, is collected before
+        # the cached memory is returned.
+        self._model.__dict__.pop("forward", None)
+        del self._model
+        gc.collect()
+        if self._device.type == "cuda":
+            torch.cuda.empty_cache()
+            torch.cuda.ipc_collect()
+
+    def _decode_image(self, image: bytes):
+        """Decode an image from bytes, reusing recently decoded images.
+
+        Parameters
+        ----------
+        image : bytes
+            The image in bytes.
+
+        Returns
+        -------
+        torch.Tensor
+            The RGB image as a uint8 tensor with shape (3, H, W).
+        """
+        key = (image_digest(image), self._device)
+        if key in _decoded_images:
+            _decoded_images.move_to_end(key)
+            return _decoded_images[key]
+        tensor = self._decode_image_uncached(image)
+        _decoded_images[key] = tensor
+        if len(_decoded_images) > _DECODED_IMAGES_CAPACITY:
+            _decoded_images.popitem(last=False)
+        return tensor
+
+    def _decode_image_uncached(self, image: bytes):
+        """Decode an image from bytes.
+
+        JPEG images are decoded on the GPU with nvJPEG when CUDA is available,
+        JPEG and PNG images are decoded by torchvision on CPU otherwise, and
+        any other format falls back to PIL.
+
+        Parameters
+        ----------
+        image : bytes
+            The image in bytes.
+
+        Returns
+        -------
+        torch.Tensor
+            The RGB image as a uint8 tensor with shape (3, H, W).
+        """
+        if image.startswith((JPEG_SIGNATURE, PNG_SIGNATURE)):
+            data = torch.frombuffer(bytearray(image), dtype=torch.uint8)
+            if image.startswith(JPEG_SIGNATURE) and self._device.type == "cuda":
+                return decode_jpeg(data, mode=ImageReadMode.RGB, device=self._device)
+            return decode_image(data, mode=ImageReadMode.RGB)
+        return pil_to_tensor(Image.open(io.BytesIO(image)).convert("RGB"))
+
+    def _to_device(self, tensor):
+        """Copy a tensor to the model device.
+
+        CPU tensors are copied to the GPU asynchronously from pinned memory, on
+        a copy stream, so the copy of an image overlaps with the kernels
+        already queued for the previous ones.
+
+        Parameters
+        ----------
+        tensor : torch.Tensor
+            The tensor to copy.
+
+        Returns
+        -------
+        torch.Tensor
+            The tensor on the model device.
+        """
+        if tensor.device == self._device:
+            return tensor
+        tensor = tensor.pin_memory()
+        if self._copy_stream is None:
+            return tensor.to(self._device, non_blocking=True)
+        with torch.cuda.stream(self._copy_stream):
+            copy = tensor.to(self._device, non_blocking=True)
+        compute_stream = torch.cuda.current_stream()
+        compute_stream.wait_stream(self._copy_stream)
+        copy.record_stream(compute_stream)
+        return copy
+
+    def _to_host(self, *tensors):
+        """Copy tensors to the host.
+
+        GPU tensors are copied asynchronously into pinned memory, without the
+        staging copy of pageable memory, and a single event recorded after
+        the last copy is waited for, rather than synchronizing each copy.
+
+        Parameters
+        ----------
+        *tensors : torch.Tensor
+            The tensors to copy.
+
+        Returns
+        -------
+        list[torch.Tensor]
+            The tensors on the host.
+        """
+        if self._device.type != "cuda":
+            return [tensor.cpu() for tensor in tensors]
+        copies = []
+        for tensor in tensors:
+            copy = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+            copies.append(copy.copy_(tensor, non_blocking=True))
+        event = torch.cuda.Event()
+        event.record()
+        event.synchronize()
+        return copies
+
     def load_image(self, image: bytes):
         """Load an image from bytes.
 
+        The decoded uint8 image is copied to the model device before it is
+        transformed, so the copy moves a quarter of the bytes of a float32
+        image and the transform runs on the GPU when CUDA is available.
+
         Parameters
         ----------
         image : bytes
@@ -69,15 +509,70 @@ class ModelWrapper(ABC):
         Returns
         -------
         torch.Tensor
-            The image as a tensor.
+            The image as a tensor with shape (3, H, W).
+        """
+        tensor = self._model.transform(self._to_device(self._decode_image(image)))
+        return tensor.to(self._input_dtype)
+
+    def load_images(self, images: list[bytes]):
+        """Load a batch of images from bytes.
+
+        Parameters
+        ----------
+        images : list[bytes]
+            The images in bytes.
+
+        Returns
+        -------
+        torch.Tensor
+            The images stacked along a new batch dimension, in the channels
+            last memory format.
+        """
+        batch = torch.stack([self.load_image(image) for image in images])
+        return batch.contiguous(memory_format=torch.channels_last)
+
+    def forward(self, batch):
+        """Run the model on a batch of loaded images.
+
+        Batches with the shape of the captured CUDA graph input replay the
+        graph instead of launching the forward pass kernels one by one.
+
+        Parameters
+        ----------
+        batch : torch.Tensor
+            The images stacked along the batch dimension.
+
+        Returns
+        -------
+        torch.Tensor | tuple[torch.Tensor, ...]
+            The model output.
         """
-        pil_img = Image.open(io.BytesIO(image))
-        if pil_img.mode == "RGBA":
-            pil_img = pil_img.convert("RGB")
-        tensor = self._model.transform(pil_img)
-        return self._device_tensor(tensor)
+        with torch.inference_mode(), self._autocast():
+            if self._graph is None or batch.shape != self._graph[1].shape:
+                return self._model(batch)
+            graph, static_input, static_output = self._graph
+            static_input.copy_(batch)
+            graph.replay()
+            if isinstance(static_output, tuple):
+                return tuple(output.clone() for output in static_output)
+            return static_output.clone()
 
     @abstractmethod
+    def batch(self, images: list[bytes], *args, **kwargs) -> list[tuple]:
+        """Evaluate a batch of images with a single forward pass.
+
+        Parameters
+        ----------
+        images : list[bytes]
+            The images in bytes.
+
+        Returns
+        -------
+        list[tuple]
+            The evaluation result of each image.
+        """
+        pass
+
     def __call__(self, image: bytes, *args, **kwargs) -> tuple:
         """Evaluate an image.
 
@@ -92,4 +587,4 @@ class ModelWrapper(ABC):
         tuple
             The evaluation result.
         """
-        pass
+        return self.batch([image], *args, **kwargs)[0]
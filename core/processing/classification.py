@@ -1,5 +1,3 @@
-from typing import cast
-
 import torch
 
 from .. import ModelWrapper
@@ -8,6 +6,25 @@ from .. import ModelWrapper
 class Classification(ModelWrapper):
     """Wrapper for a models that receives an image and returns disease and severity classes."""
 
+    def batch(self, images: list[bytes], *args, **kwargs) -> list[tuple[int, int]]:
+        """Classify a batch of images.
+
+        Parameters
+        ----------
+        images : list[bytes]
+            The images to classify.
+
+        Returns
+        -------
+        list[tuple[int, int]]
+            The disease and severity classes of each image.
+        """
+        out_dis, out_sev = self.forward(self.load_images(images))
+        (classes,) = self._to_host(
+            torch.stack([out_dis.argmax(dim=1), out_sev.argmax(dim=1)], dim=1)
+        )
+        return [(dis_cls, sev_cls) for dis_cls, sev_cls in classes.tolist()]
+
     def __call__(self, image: bytes, *args, **kwargs) -> tuple[int, int]:
         """Classify an image.
 
@@ -23,10 +40,4 @@ class Classification(ModelWrapper):
         int
             The severity class.
         """
-        image = self.load_image(image)
-        out_dis, out_sev = self.model(image)
-        out_dis = torch.nn.functional.softmax(out_dis, dim=1)
-        _, dis_cls = torch.max(out_dis, 1)
-        out_sev = torch.nn.functional.softmax(out_sev, dim=1)
-        _, sev_cls = torch.max(out_sev, 1)
-        return cast(int, dis_cls.item()), cast(int, sev_cls.item())
+        return self.batch([image])[0]
@@ -1,41 +1,51 @@
-from typing import cast
+import math
+from collections import OrderedDict
 
+import cv2
 import numpy as np
 import torch
-from PIL import Image
 
-from .. import ModelWrapper
+from .. import ModelWrapper, image_digest
+
+# Mask colors indexed by class: background, leaf and stress.
+_MASK_PALETTE = np.array([[0, 0, 0], [0, 255, 0], [255, 0, 0]], dtype=np.uint8)
+# Class map bit flagging pixels whose predominant class is ambiguous.
+_AMBIGUOUS = 0x80
+# Highest stress ratio of each severity but the last. Only the first edge is
+# exclusive, hence the largest float below 0.001.
+_SEVERITY_EDGES = np.array([np.nextafter(0.001, 0), 0.05, 0.1, 0.15])
+# Number of recent results kept per model. Results with masks hold a full size
+# mask each, hence the small capacity.
+_RESULTS_CAPACITY = 16
 
 
 class Segmentation(ModelWrapper):
     """Wrapper for a models that receives an image and returns a segmentation mask."""
 
-    def _get_stress_ratio_and_severity(self, output) -> tuple[float, int]:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Recent results by image digest and mask flag, reused when the same
+        # image is processed again, such as when a report is resubmitted.
+        self._results: OrderedDict[tuple[bytes, bool], tuple] = OrderedDict()
+
+    def _get_stress_ratio_and_severity(self, counts) -> tuple[float, int]:
         """Calculate the stress ratio and severity.
 
         Parameters
         ----------
-        output : torch.Tensor
-            The model output.
+        counts : list[int]
+            Pixel count of each class.
 
         Returns
         -------
         tuple[float, int]
             The stress ratio and severity.
         """
-        stress_pixels = torch.count_nonzero(
-            (output[0, 2, ...] > output[0, 0, ...])
-            & (output[0, 2, ...] > output[0, 1, ...])
-        )
-        leaf_pixels = torch.count_nonzero(
-            (output[0, 1, ...] > output[0, 0, ...])
-            & (output[0, 1, ...] > output[0, 2, ...])
-        )
-        stress_ratio: float = cast(
-            float, stress_pixels.float() / (leaf_pixels + stress_pixels).float()
-        )
+        leaf_pixels, stress_pixels = counts[1:]
+        total_pixels = leaf_pixels + stress_pixels
+        stress_ratio = stress_pixels / total_pixels if total_pixels else float("nan")
         severity = self._ratio_to_severity(stress_ratio)
-        return float(stress_ratio), severity
+        return stress_ratio, severity
 
     @staticmethod
     def _ratio_to_severity(stress_ratio: float) -> int:
@@ -49,75 +59,157 @@ class Segmentation(ModelWrapper):
         Returns
         -------
         int
-            The severity.
+            The severity. NaN ratios map to -1.
         """
-        if stress_ratio < 0.001:
-            return 0
-        elif 0.001 <= stress_ratio <= 0.05:
-            return 1
-        elif 0.05 < stress_ratio <= 0.1:
-            return 2
-        elif 0.1 < stress_ratio <= 0.15:
-            return 3
-        elif stress_ratio > 0.15:
-            return 4
-        return -1
+        if math.isnan(stress_ratio):
+            return -1
+        return int(np.searchsorted(_SEVERITY_EDGES, stress_ratio))
 
     @staticmethod
-    def _generate_mask(output) -> bytes:
-        """Generate a mask from the model output.
+    def _get_class_map(output):
+        """Get the predominant class of each pixel of an image's model output.
+
+        The output logits are converted to log probabilities, scaled to the
+        0-255 range and quantized before comparing the channels, so pixels
+        whose channels tie are flagged as ambiguous with the ``_AMBIGUOUS``
+        bit. The computation runs on the output device, so only the resulting
+        single byte per pixel has to be copied to the host.
 
         Parameters
         ----------
         output : torch.Tensor
-            The model output.
+            The model output of a single image.
+
+        Returns
+        -------
+        torch.Tensor
+            The class map, on the output device.
+        """
+        output = torch.log_softmax(output, dim=0)
+        output = (output - output.min()) * (255 / (output.max() - output.min()))
+        output = output.to(torch.uint8)
+        top, classes = output.max(dim=0)
+        ambiguous = torch.count_nonzero(output == top, dim=0) > 1
+        classes = classes.to(torch.uint8) | (ambiguous.to(torch.uint8) * _AMBIGUOUS)
+        return classes
+
+    @staticmethod
+    def _generate_mask(class_map) -> bytes:
+        """Generate a mask from the class map.
+
+        Each pixel is painted with the color of its predominant class. Pixels
+        whose class is ambiguous take the most frequent class among their
+        unambiguous 3x3 neighbors.
+
+        Parameters
+        ----------
+        class_map : np.ndarray
+            The class map.
 
         Returns
         -------
         bytes
             The mask.
         """
-        output = output.cpu().numpy()
-        output = np.squeeze(output, axis=0)
-        output = np.transpose(output, (1, 2, 0))
-        output = output.astype(np.uint8)
-        output = output[..., ::-1]
-        output[
-            (output[..., 2] > output[..., 0]) & (output[..., 2] > output[..., 1])
-        ] = [
-            0,
-            0,
-            0,
-        ]
-        output[
-            (output[..., 0] > output[..., 1]) & (output[..., 0] > output[..., 2])
-        ] = [
-            255,
-            0,
-            0,
+        ambiguous = (class_map & _AMBIGUOUS).astype(bool)
+        classes = class_map & ~np.uint8(_AMBIGUOUS)
+        counts = np.stack(
+            [
+                cv2.boxFilter(
+                    (class_map == c).astype(np.uint8),
+                    ddepth=-1,
+                    ksize=(3, 3),
+                    normalize=False,
+                    borderType=cv2.BORDER_CONSTANT,
+                )
+                for c in range(len(_MASK_PALETTE))
+            ]
+        )
+        ambiguous &= counts.max(axis=0) > 0
+        classes[ambiguous] = counts.argmax(axis=0)[ambiguous]
+        return _MASK_PALETTE[classes].tobytes()
+
+    def batch(
+        self, images: list[bytes], generate_masks: list[bool] | None = None
+    ) -> list[tuple[float, int, bytes | None]]:
+        """Process a batch of images.
+
+        Images processed recently with the same mask flag reuse their result
+        instead of being evaluated again.
+
+        Parameters
+        ----------
+        images : list[bytes]
+            Images bytes.
+        generate_masks : list[bool] | None, optional
+            Indicates if a mask should be generated for each image, by default None (no masks).
+
+        Returns
+        -------
+        list[tuple[float, int, bytes | None]]
+            The stress ratio, severity and mask of each image.
+        """
+        if generate_masks is None:
+            generate_masks = [False] * len(images)
+        keys = [
+            (image_digest(image), generate_mask)
+            for image, generate_mask in zip(images, generate_masks)
         ]
-        output[
-            (output[..., 1] > output[..., 0]) & (output[..., 1] > output[..., 2])
-        ] = [
-            0,
-            255,
-            0,
+        missing = {key: i for i, key in enumerate(keys) if key not in self._results}
+        if missing:
+            indices = list(missing.values())
+            results = self._batch(
+                [images[i] for i in indices], [generate_masks[i] for i in indices]
+            )
+            for key, result in zip(missing, results):
+                self._results[key] = result
+        for key in keys:
+            self._results.move_to_end(key)
+        batch_results = [self._results[key] for key in keys]
+        while len(self._results) > _RESULTS_CAPACITY:
+            self._results.popitem(last=False)
+        return batch_results
+
+    def _batch(
+        self, images: list[bytes], generate_masks: list[bool]
+    ) -> list[tuple[float, int, bytes | None]]:
+        """Process a batch of images with a single forward pass.
+
+        Parameters
+        ----------
+        images : list[bytes]
+            Images bytes.
+        generate_masks : list[bool]
+            Indicates if a mask should be generated for each image.
+
+        Returns
+        -------
+        list[tuple[float, int, bytes | None]]
+            The stress ratio, severity and mask of each image.
+        """
+        output, _ = self.forward(self.load_images(images))
+        n_classes = len(_MASK_PALETTE)
+        offsets = torch.arange(len(images), device=output.device) * n_classes
+        counts = torch.bincount(
+            (output.argmax(dim=1) + offsets.view(-1, 1, 1)).flatten(),
+            minlength=n_classes * len(images),
+        )
+        mask_indices = [
+            i for i, generate_mask in enumerate(generate_masks) if generate_mask
         ]
-        for i in range(1, output.shape[0] - 1):
-            for j in range(1, output.shape[1] - 1):
-                if np.all(output[i, j] == [0, 0, 0]):
-                    continue
-                elif np.all(output[i, j] == [255, 0, 0]):
-                    continue
-                elif np.all(output[i, j] == [0, 255, 0]):
-                    continue
-                neighborhood = output[i - 1 : i + 2, j - 1 : j + 2]  # noqa
-                unique, counts = np.unique(
-                    neighborhood.reshape(-1, 3), axis=0, return_counts=True
-                )
-                predominant_pixel = unique[np.argmax(counts)]
-                output[i, j] = predominant_pixel
-        return Image.fromarray(output).tobytes()
+        counts, *class_maps = self._to_host(
+            counts.view(-1, n_classes),
+            *(self._get_class_map(output[i]) for i in mask_indices),
+        )
+        class_maps_by_index = dict(zip(mask_indices, class_maps))
+        results = []
+        for i, image_counts in enumerate(counts.tolist()):
+            stress_ratio, severity = self._get_stress_ratio_and_severity(image_counts)
+            mask = None
+            if i in class_maps_by_index:
+                mask = self._generate_mask(class_maps_by_index[i].numpy())
+            results.append((stress_ratio, severity, mask))
+        return results
 
     def __call__(
         self, image: bytes, generate_mask=False
@@ -136,12 +228,4 @@ class Segmentation(ModelWrapper):
         tuple[float, int, bytes | None]
             The stress ratio, severity and mask.
         """
-        img = self.load_image(image)
-        with torch.no_grad():
-            output, cls = self.model(img)
-        output = (output - output.min()) * (255 / (output.max() - output.min()))
-        stress_ratio, severity = self._get_stress_ratio_and_severity(output)
-        mask = None
-        if generate_mask:
-            mask = self._generate_mask(output)
-        return stress_ratio, severity, mask
+        return self.batch([image], [generate_mask])[0]
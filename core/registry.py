@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Mapping
+
+from . import ModelWrapper
+
+
+class ModelRegistry(Mapping[int, ModelWrapper]):
+    """Mapping of model IDs to model wrappers that are loaded on first access.
+
+    At most ``capacity`` models are kept loaded at the same time. When a model
+    that is not loaded is requested and the registry is full, the least
+    recently used model is evicted before the new one is loaded.
+
+    Parameters
+    ----------
+    Mapping : collections.abc.Mapping
+        Read-only mapping abstract base class.
+    """
+
+    def __init__(
+        self,
+        model_ids: Iterable[int],
+        loader: Callable[[int], ModelWrapper],
+        capacity: int | None = None,
+    ):
+        """Initialize the registry.
+
+        Parameters
+        ----------
+        model_ids : Iterable[int]
+            IDs of the models that can be loaded.
+        loader : Callable[[int], ModelWrapper]
+            Function that loads a model from its ID.
+        capacity : int | None, optional
+            Maximum number of loaded models, by default None (unbounded).
+
+        Raises
+        ------
+        ValueError
+            If the capacity is not positive.
+        """
+        if capacity is not None and capacity < 1:
+            raise ValueError(f"Invalid capacity: {capacity}")
+        self._model_ids = list(model_ids)
+        self._loader = loader
+        self._capacity = capacity
+        self._models: OrderedDict[int, ModelWrapper] = OrderedDict()
+
+    def __getitem__(self, model_id: int) -> ModelWrapper:
+        if model_id in self._models:
+            self._models.move_to_end(model_id)
+            return self._models[model_id]
+        if model_id not in self._model_ids:
+            raise KeyError(model_id)
+        while self._capacity is not None and len(self._models) >= self._capacity:
+            self._evict()
+        model = self._loader(model_id)
+        self._models[model_id] = model
+        return model
+
+    def __contains__(self, model_id: object) -> bool:
+        return model_id in self._model_ids
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._model_ids)
+
+    def __len__(self) -> int:
+        return len(self._model_ids)
+
+    def _evict(self):
+        """Evict the least recently used model."""
+        _, model = self._models.popitem(last=False)
+        model.release()
+
+    def preload(self):
+        """Load models up to the registry capacity."""
+        for model_id in self._model_ids[: self._capacity]:
+            self[model_id]
@@ -4,6 +4,23 @@ from .. import ModelWrapper
 class CoffeeLeafOCC(ModelWrapper):
     """Wrapper for one-class classification models that identify if an image contains a coffee leaf."""
 
+    def batch(self, images: list[bytes], *args, **kwargs) -> list[tuple[int]]:
+        """Classify a batch of images.
+
+        Parameters
+        ----------
+        images : list[bytes]
+            The images to classify.
+
+        Returns
+        -------
+        list[tuple[int]]
+            The classification result of each image.
+        """
+        out_is_coffee_leaf = self.forward(self.load_images(images))
+        (is_coffee_leaf,) = self._to_host(1 - out_is_coffee_leaf.argmax(dim=1))
+        return [(x,) for x in is_coffee_leaf.tolist()]
+
     def __call__(self, image: bytes, *args, **kwargs) -> tuple[int]:
         """Classify an image.
 
@@ -17,7 +34,4 @@ class CoffeeLeafOCC(ModelWrapper):
         tuple[int]
             The classification result.
         """
-        image = self.load_image(image)
-        out_is_coffee_leaf = self.model(image)
-        is_coffee_leaf = out_is_coffee_leaf.argmax().item() ^ 1
-        return (is_coffee_leaf,)
+        return self.batch([image])[0]
@@ -1,13 +1,23 @@
-import os
-import tomllib
+import struct
 from argparse import ArgumentParser
+from pathlib import Path
 
+from config import load_settings
+from image_signatures import JPEG_SIGNATURE, PNG_SIGNATURE
 from interfaces import InterfaceFactory
 from interfaces.database import Database
 from interfaces.queue import Queue
 from interfaces.storage import Storage
 from models import ProcessingModelType
 
+# Largest image accepted, in pixels. PIL refuses to decode larger images as
+# decompression bombs.
+MAX_IMAGE_PIXELS = 89_478_485
+# JPEG start of frame markers, which hold the image size.
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# JPEG markers without a length field.
+_JPEG_STANDALONE_MARKERS = frozenset({0x01, *range(0xD0, 0xD8)})
+
 
 def cli():
     """CLI for enqueue_report.py
@@ -20,13 +30,11 @@ def cli():
     parser = ArgumentParser()
     parser.add_argument(
         "settings",
-        type=lambda x: tomllib.load(open(x, "rb")),
+        type=load_settings,
         help="Path to the settings file",
     )
     parser.add_argument("user_id", type=int, help="User ID")
-    parser.add_argument(
-        "image", type=lambda x: open(x, "rb"), help="Path to the image file"
-    )
+    parser.add_argument("image", type=Path, help="Path to the image file")
     parser.add_argument("processing_model_id", type=int, help="Processing model ID")
     parser.add_argument(
         "-v", "--validation-model-id", type=int, help="Validation model ID"
@@ -48,6 +56,59 @@ def cli():
     return parser.parse_args()
 
 
+def _peek_image_metadata(image: bytes) -> tuple[int, int, str] | None:
+    """Read the size and format of an image from its header, without decoding it.
+
+    Parameters
+    ----------
+    image : bytes
+        Image bytes.
+
+    Returns
+    -------
+    tuple[int, int, str] | None
+        The width, height and format of JPEG and PNG images, None for other formats.
+
+    Raises
+    ------
+    ValueError
+        If a JPEG or PNG header is malformed or the image is empty.
+    """
+    if image.startswith(PNG_SIGNATURE):
+        if len(image) < 24 or image[12:16] != b"IHDR":
+            raise ValueError("Malformed PNG header")
+        width, height = struct.unpack(">II", image[16:24])
+        fmt = "PNG"
+    elif image.startswith(JPEG_SIGNATURE):
+        # Scan from the marker following the 2 byte start of image marker.
+        offset = 2
+        while True:
+            offset = image.find(b"\xff", offset)
+            while 0 <= offset < len(image) - 1 and image[offset + 1] == 0xFF:
+                offset += 1
+            if offset < 0 or offset + 4 > len(image):
+                raise ValueError("Malformed JPEG header: no start of frame marker")
+            marker = image[offset + 1]
+            if marker in _JPEG_STANDALONE_MARKERS:
+                offset += 2
+                continue
+            if marker in (0xD9, 0xDA):
+                raise ValueError("Malformed JPEG header: no start of frame marker")
+            if marker in _JPEG_SOF_MARKERS:
+                if offset + 9 > len(image):
+                    raise ValueError("Malformed JPEG header: truncated frame")
+                height, width = struct.unpack(">HH", image[offset + 5 : offset + 9])
+                break
+            (length,) = struct.unpack(">H", image[offset + 2 : offset + 4])
+            offset += 2 + length
+        fmt = "JPEG"
+    else:
+        return None
+    if not width or not height:
+        raise ValueError(f"Empty {fmt} image: {width}x{height}")
+    return width, height, fmt
+
+
 def enqueue_report(
     database: Database,
     queue: Queue,
@@ -89,6 +150,12 @@ def enqueue_report(
     -------
     int
         Report ID.
+
+    Raises
+    ------
+    ValueError
+        If the model type does not match, the image header is malformed or the
+        image is too large.
     """
     _processing_model_type = database.enabled_models[processing_model_id].type
     if processing_model_type != _processing_model_type:
@@ -96,21 +163,20 @@ def enqueue_report(
             f"Model type mismatch: {processing_model_type} expected, "
             f"{_processing_model_type} found"
         )
-    image_id = database.insert_image(user_id, filename)
-    storage.store_image(image, image_id)
-    match processing_model_type:
-        case ProcessingModelType.CLASSIFICATION:
-            if generate_mask:
-                raise ValueError("Classification models do not generate masks")
-            report_id = database.insert_classification_report(
-                user_id, image_id, processing_model_id
-            )
-        case ProcessingModelType.SEGMENTATION:
-            report_id = database.insert_segmentation_report(
-                user_id, image_id, processing_model_id, generate_mask
+    metadata = _peek_image_metadata(image)
+    if metadata is not None:
+        width, height, fmt = metadata
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ValueError(
+                f"{fmt} image too large: {width}x{height}, "
+                f"at most {MAX_IMAGE_PIXELS} pixels accepted"
             )
-        case _:
-            raise ValueError(f"Invalid model type: {processing_model_type}")
+    image_id, report_id = database.insert_report_bundle(
+        user_id, filename, processing_model_id, processing_model_type, generate_mask
+    )
+    # The image is stored before the report is enqueued, so consumers never
+    # see a report whose image failed to be stored.
+    storage.store_image(image, image_id)
     if validation_model_id is None:
         queue.enqueue_to_processing_queue(
             image_id,
@@ -152,8 +218,8 @@ if __name__ == "__main__":
         queue,
         storage,
         args.user_id,
-        os.path.basename(args.image.name),
-        args.image.read(),
+        args.image.name,
+        args.image.read_bytes(),
         args.processing_model_id,
         processing_model_type,
         generate_mask,
@@ -0,0 +1,3 @@
+# Leading bytes identifying the image formats decoded without PIL.
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
@@ -1,6 +1,8 @@
-import tomllib
 from argparse import ArgumentParser
+from pathlib import Path
+from typing import BinaryIO
 
+from config import load_settings
 from interfaces import InterfaceFactory
 from interfaces.database import Database
 from interfaces.storage import Storage
@@ -18,7 +20,7 @@ def cli():
     parser = ArgumentParser()
     parser.add_argument(
         "settings",
-        type=lambda x: tomllib.load(open(x, "rb")),
+        type=load_settings,
         help="Path to the settings file",
     )
     subparser = parser.add_subparsers(
@@ -43,7 +45,7 @@ def cli():
         parser_.add_argument("version", type=str, help="Model version")
         parser_.add_argument(
             "weights",
-            type=lambda x: open(x, "rb").read(),
+            type=Path,
             help="Path to the weights file",
         )
         parser_.add_argument(
@@ -63,7 +65,7 @@ def insert_model(
     class_name: str,
     version: str,
     enabled: bool,
-    weights: bytes,
+    weights: BinaryIO,
 ):
     """Insert a model.
 
@@ -87,8 +89,8 @@ def insert_model(
         Semantic version of the model.
     enabled : bool
         Indicates if the model is enabled.
-    weights : bytes
-        Weights of the model.
+    weights : BinaryIO
+        Stream of the model weights.
     """
     model_id = database.insert_model(
         model_category, model_type, subtype, module, class_name, version, enabled
@@ -103,15 +105,16 @@ if __name__ == "__main__":
     storage = interface_factory.get_interface(Storage)  # type: ignore
     model_category = ModelCategory[args.category.upper()]
     model_type = model_category.value[args.type.upper()]
-    insert_model(
-        database,
-        storage,
-        model_category,
-        model_type,
-        args.subtype,
-        args.module,
-        args.class_name,
-        args.version,
-        args.enabled,
-        args.weights,
-    )
+    with args.weights.open("rb") as weights:
+        insert_model(
+            database,
+            storage,
+            model_category,
+            model_type,
+            args.subtype,
+            args.module,
+            args.class_name,
+            args.version,
+            args.enabled,
+            weights,
+        )
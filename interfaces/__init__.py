@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from importlib import import_module
-from typing import Type, TypeVar
+from typing import Iterator, Type, TypeVar
 
 
 class Interface(ABC):
@@ -23,6 +24,14 @@ class Interface(ABC):
         """
         pass
 
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group the writes made through the interface inside the context in a single transaction.
+
+        By default, each write is committed on its own.
+        """
+        yield
+
 
 T = TypeVar("T", bound="Interface")
 
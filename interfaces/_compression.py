@@ -0,0 +1,45 @@
+import zstandard
+
+from image_signatures import JPEG_SIGNATURE, PNG_SIGNATURE
+
+COMPRESSION_LEVEL = 3
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Signatures of JPEG, PNG and zstd data, which are not worth compressing.
+_COMPRESSED_SIGNATURES = (JPEG_SIGNATURE, PNG_SIGNATURE, _ZSTD_MAGIC)
+
+
+def compress(data: bytes) -> bytes:
+    """Compress data with zstd, unless it is already compressed.
+
+    Parameters
+    ----------
+    data : bytes
+        Data to compress.
+
+    Returns
+    -------
+    bytes
+        Compressed data, or the data itself if it is already compressed.
+    """
+    if data.startswith(_COMPRESSED_SIGNATURES):
+        return data
+    return zstandard.compress(data, COMPRESSION_LEVEL)
+
+
+def decompress(data: bytes) -> bytes:
+    """Decompress data compressed with compress.
+
+    Parameters
+    ----------
+    data : bytes
+        Data to decompress.
+
+    Returns
+    -------
+    bytes
+        Decompressed data, or the data itself if it is not zstd compressed.
+    """
+    if not data.startswith(_ZSTD_MAGIC):
+        return data
+    return zstandard.decompress(data)
@@ -0,0 +1,183 @@
+import sys
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Iterator
+
+from mysql.connector.pooling import MySQLConnectionPool, PooledMySQLConnection
+
+DEFAULT_POOL_SIZE = 4
+
+_pools: dict[tuple, MySQLConnectionPool] = dict()
+# Connection bound to the transaction open in the current thread, by pool name.
+_transactions = threading.local()
+# Prepared statement cursors of each connection, by statement, along with the
+# server session they were prepared in, as reconnecting discards them.
+_prepared_cursors: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_pool(module_settings: dict, **kwargs) -> MySQLConnectionPool:
+    """Get the connection pool of a MySQL database.
+
+    Interfaces connecting to the same database with the same options share a
+    single pool. Connections use the C extension unless use_pure is set.
+
+    Parameters
+    ----------
+    module_settings : dict
+        Module settings with the connection parameters and, optionally, the pool size.
+    **kwargs
+        Additional connection options.
+
+    Returns
+    -------
+    MySQLConnectionPool
+        Connection pool.
+    """
+    config = dict(
+        host=module_settings["host"],
+        port=module_settings["port"],
+        user=module_settings["user"],
+        password=module_settings["password"],
+        database=module_settings["database"],
+        use_pure=False,
+    )
+    config.update(kwargs)
+    key = tuple(sorted(config.items()))
+    if key not in _pools:
+        _pools[key] = MySQLConnectionPool(
+            pool_name=f"target-ai-consumer-{len(_pools)}",
+            pool_size=module_settings.get("pool_size", DEFAULT_POOL_SIZE),
+            pool_reset_session=False,
+            autocommit=True,
+            init_command="SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED",
+            **config,
+        )
+    return _pools[key]
+
+
+@contextmanager
+def pooled_connection(pool: MySQLConnectionPool) -> Iterator[PooledMySQLConnection]:
+    """Borrow a connection from a pool.
+
+    Inside a transaction, the connection bound to the transaction is yielded
+    instead. Otherwise, the connection is returned to the pool on exit. Pooled
+    connections autocommit each statement, so only a transaction explicitly
+    started with the connection is committed on exit, or rolled back on error.
+
+    Parameters
+    ----------
+    pool : MySQLConnectionPool
+        Connection pool.
+
+    Yields
+    ------
+    PooledMySQLConnection
+        Connection.
+    """
+    bound_connection = getattr(_transactions, pool.pool_name, None)
+    if bound_connection is not None:
+        yield bound_connection
+        return
+    connection = pool.get_connection()
+    try:
+        yield connection
+        if connection.in_transaction:
+            connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def prepared_cursor(connection: PooledMySQLConnection, operation: str):
+    """Get the cursor of a statement prepared on a connection.
+
+    The statement is prepared on first use and reused by every later
+    borrower of the same connection.
+
+    Parameters
+    ----------
+    connection : PooledMySQLConnection
+        Connection.
+    operation : str
+        Statement.
+
+    Returns
+    -------
+    MySQLCursorAbstract
+        Prepared cursor.
+    """
+    # Pooled connections wrap the connection kept by the pool.
+    cnx = getattr(connection, "_cnx", connection)
+    session_id, cursors = _prepared_cursors.get(cnx, (None, None))
+    if cursors is None or session_id != cnx.connection_id:
+        cursors = dict()
+        _prepared_cursors[cnx] = (cnx.connection_id, cursors)
+    if operation not in cursors:
+        cursors[operation] = connection.cursor(prepared=True)
+    return cursors[operation]
+
+
+@contextmanager
+def transaction(pool: MySQLConnectionPool) -> Iterator[None]:
+    """Run the work done with a pool in the current thread in a single transaction.
+
+    The transaction is committed on exit, or rolled back on error. Nested
+    transactions join the outermost one.
+
+    Parameters
+    ----------
+    pool : MySQLConnectionPool
+        Connection pool.
+    """
+    if getattr(_transactions, pool.pool_name, None) is not None:
+        yield
+        return
+    with pooled_connection(pool) as connection:
+        connection.start_transaction()
+        setattr(_transactions, pool.pool_name, connection)
+        try:
+            yield
+        finally:
+            delattr(_transactions, pool.pool_name)
+
+
+class MySQLInterface:
+    """Mixin for the interfaces backed by a MySQL connection pool."""
+
+    _pool: MySQLConnectionPool
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with transaction(self._pool):
+            yield
+
+    def _execute_prepared(self, operation: str, params: tuple) -> int | None:
+        """Execute a write statement prepared once per pooled connection.
+
+        Parameters of prepared statements are sent in binary, so it suits
+        statements writing large BLOBs, which would otherwise be escaped into
+        the statement text. The connector resets the statement before each
+        execution, an extra round trip not worth it for small writes.
+
+        Parameters
+        ----------
+        operation : str
+            Statement.
+        params : tuple
+            Statement parameters.
+
+        Returns
+        -------
+        int | None
+            ID of the last inserted row, if any.
+        """
+        # The connector prepares the statement again unless given the very
+        # same string object.
+        operation = sys.intern(operation)
+        with pooled_connection(self._pool) as connection:
+            cursor = prepared_cursor(connection, operation)
+            cursor.execute(operation, params)
+            return cursor.lastrowid
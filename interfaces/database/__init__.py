@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from functools import cached_property
 
 from models import Model, ModelCategory
 from models.processing import ProcessingModelType
@@ -54,9 +55,70 @@ class Database(Interface, ABC):
         """
         pass
 
-    @property
     @abstractmethod
+    def update_classification_reports(self, rows: list[tuple[int, int, int]]):
+        """Update classification reports with a single statement.
+
+        Parameters
+        ----------
+        rows : list[tuple[int, int, int]]
+            Report ID, disease ID and severity ID of each report.
+        """
+        pass
+
+    @abstractmethod
+    def update_segmentation_reports(self, rows: list[tuple[int, float, int]]):
+        """Update segmentation reports with a single statement.
+
+        Parameters
+        ----------
+        rows : list[tuple[int, float, int]]
+            Report ID, stress ratio and severity ID of each report.
+        """
+        pass
+
+    @cached_property
     def enabled_models(self) -> dict[int, Model]:
+        """Enabled models as a dictionary with the model ID as the key.
+
+        The models are read from the database on first access and cached until
+        invalidate_model_cache is called.
+
+        Returns
+        -------
+        dict[int, Model]
+            Enabled models.
+        """
+        return self._get_enabled_models()
+
+    @cached_property
+    def model_category_dict(self) -> dict[str, int]:
+        """Model category dictionary with the model category as the key and the model category ID as the value.
+
+        Returns
+        -------
+        dict[str, int]
+            Model category IDs.
+        """
+        return self._get_model_category_dict()
+
+    @cached_property
+    def model_type_dict(self) -> dict[str, int]:
+        """Model type dictionary with the model type as the key and the model type ID as the value.
+
+        Returns
+        -------
+        dict[str, int]
+            Model type IDs.
+        """
+        return self._get_model_type_dict()
+
+    def invalidate_model_cache(self):
+        """Discard the cached enabled models so they are read again on next access."""
+        self.__dict__.pop("enabled_models", None)
+
+    @abstractmethod
+    def _get_enabled_models(self) -> dict[int, Model]:
         """Get enabled models from the database and return them as a dictionary with the model ID as the key.
 
         Returns
@@ -66,15 +128,13 @@ class Database(Interface, ABC):
         """
         pass
 
-    @property
     @abstractmethod
-    def model_category_dict(self) -> dict[str, int]:
+    def _get_model_category_dict(self) -> dict[str, int]:
         """Get the model category dictionary from the database and return it as a dictionary with the model category as the key and the model category ID as the value."""
         pass
 
-    @property
     @abstractmethod
-    def model_type_dict(self) -> dict[str, int]:
+    def _get_model_type_dict(self) -> dict[str, int]:
         """Get the model type dictionary from the database and return it as a dictionary with the model type as the key and the model type ID as the value."""
         pass
 
@@ -113,9 +173,11 @@ class Database(Interface, ABC):
             Model ID.
         """
         ModelCategory.validate_model_category_type(model_category, model_type)
-        return self._insert_model(
+        model_id = self._insert_model(
             model_category, model_type, subtype, module, class_name, version, enabled
         )
+        self.invalidate_model_cache()
+        return model_id
 
     @abstractmethod
     def _insert_model(
@@ -218,6 +280,82 @@ class Database(Interface, ABC):
         """
         pass
 
+    def insert_report_bundle(
+        self,
+        user_id: int,
+        filename: str,
+        model_id: int,
+        report_type: ProcessingModelType,
+        has_mask: bool = False,
+    ) -> tuple[int, int]:
+        """Template method to insert an image and its report into the database in a single transaction.
+
+        Parameters
+        ----------
+        user_id : int
+            User ID.
+        filename : str
+            Image filename.
+        model_id : int
+            Processing model ID.
+        report_type : ProcessingModelType
+            Report type.
+        has_mask : bool, optional
+            Indicates if the report has a mask, by default False
+
+        Returns
+        -------
+        tuple[int, int]
+            Image ID and report ID.
+
+        Raises
+        ------
+        ValueError
+            If the report type is invalid or a classification report has a mask.
+        """
+        match report_type:
+            case ProcessingModelType.CLASSIFICATION:
+                if has_mask:
+                    raise ValueError("Classification models do not generate masks")
+            case ProcessingModelType.SEGMENTATION:
+                pass
+            case _:
+                raise ValueError(f"Invalid report type: {report_type}")
+        return self._insert_report_bundle(
+            user_id, filename, model_id, report_type, has_mask
+        )
+
+    @abstractmethod
+    def _insert_report_bundle(
+        self,
+        user_id: int,
+        filename: str,
+        model_id: int,
+        report_type: ProcessingModelType,
+        has_mask: bool,
+    ) -> tuple[int, int]:
+        """Insert an image and its report into the database in a single transaction.
+
+        Parameters
+        ----------
+        user_id : int
+            User ID.
+        filename : str
+            Image filename.
+        model_id : int
+            Processing model ID.
+        report_type : ProcessingModelType
+            Report type.
+        has_mask : bool
+            Indicates if the report has a mask.
+
+        Returns
+        -------
+        tuple[int, int]
+            Image ID and report ID.
+        """
+        pass
+
     @abstractmethod
     def update_report_validity(
         self, report_id: int, report_type: ProcessingModelType, valid: bool
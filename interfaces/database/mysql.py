@@ -1,15 +1,20 @@
 from typing import cast
 
-import mysql.connector
-
 from models import Model, ModelCategory
 from models.processing import ProcessingModelType
 from models.validation import ValidationModelType
 
+from .._mysql import MySQLInterface, get_pool, pooled_connection
 from . import Database
 
+# Lookup tables and enabled models shared by the instances connected to the
+# same database, by pool name. Lookup tables are fixed at runtime, enabled
+# models are read again after invalidate_model_cache.
+_lookup_tables: dict[tuple[str, str, str, str], dict] = dict()
+_enabled_models: dict[str, dict[int, Model]] = dict()
+
 
-class MySQLDatabase(Database):
+class MySQLDatabase(MySQLInterface, Database):
     """Implementation of the database interface for MySQL.
 
     Parameters
@@ -19,106 +24,116 @@ class MySQLDatabase(Database):
     """
 
     def __init__(self, module_settings: dict):
-        self.connection = mysql.connector.connect(
-            host=module_settings["host"],
-            port=module_settings["port"],
-            user=module_settings["user"],
-            password=module_settings["password"],
-            database=module_settings["database"],
-        )
-        cursor = self.connection.cursor()
-        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
-        cursor.close()
-        self._model_category_dict = self._get_dict_from_database(
-            "MODEL_CATEGORY", "NAME", "ID"
-        )
-        self._model_type_dict = self._get_dict_from_database("MODEL_TYPE", "NAME", "ID")
-        self._enabled_models = self._get_enabled_models()
-
-    def _get_cursor(self, *args, **kwargs):
-        """Get a cursor ensuring the connection is active.
-
-        Returns
-        -------
-        MySQLCursorAbstract
-            Cursor.
-        """
-        if not self.connection.is_connected():
-            self.connection.reconnect()
-        return self.connection.cursor(*args, **kwargs)
+        self._pool = get_pool(module_settings)
 
     def update_classification_report(
         self, report_id: int, disease_id: int, severity_id: int
     ):
-        cursor = self._get_cursor()
-        cursor.execute(
-            """UPDATE CLASSIFICATION_REPORT
-            SET DISEASE_ID = %s,
-            SEVERITY_ID = %s,
-            PROCESSED_AT = NOW()
-            WHERE ID = %s""",
-            (disease_id, severity_id, report_id),
-        )
-        self.connection.commit()
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """UPDATE CLASSIFICATION_REPORT
+                SET DISEASE_ID = %s,
+                SEVERITY_ID = %s,
+                PROCESSED_AT = NOW()
+                WHERE ID = %s""",
+                (disease_id, severity_id, report_id),
+            )
 
     def update_segmentation_report(
         self, report_id: int, stress_ratio: float, severity_id: int
     ):
-        cursor = self._get_cursor()
-        cursor.execute(
-            """UPDATE SEGMENTATION_REPORT
-            SET STRESS_RATIO = %s,
-            SEVERITY_ID = %s,
-            PROCESSED_AT = NOW()
-            WHERE ID = %s""",
-            (stress_ratio, severity_id, report_id),
-        )
-        self.connection.commit()
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """UPDATE SEGMENTATION_REPORT
+                SET STRESS_RATIO = %s,
+                SEVERITY_ID = %s,
+                PROCESSED_AT = NOW()
+                WHERE ID = %s""",
+                (stress_ratio, severity_id, report_id),
+            )
 
-    def _get_enabled_models(self) -> dict[int, Model]:
-        """Get enabled models from the database and return them as a dictionary with the model ID as the key.
+    def _update_many(
+        self, table_name: str, columns: tuple[str, ...], rows: list[tuple]
+    ):
+        """Update reports by ID with a single statement and mark them as processed.
 
-        Returns
-        -------
-        dict[int, Model]
-            Enabled models.
+        Parameters
+        ----------
+        table_name : str
+            Name of the report table.
+        columns : tuple[str, ...]
+            Names of the updated columns.
+        rows : list[tuple]
+            Report ID followed by the value of each column, for each report.
         """
-        cursor = self._get_cursor(dictionary=True)
-        cursor.execute(
-            """SELECT M.ID,
-            MC.NAME AS CATEGORY,
-            MT.NAME AS TYPE,
-            M.SUBTYPE,
-            M.MODULE,
-            M.CLASS
-            FROM MODEL M
-            JOIN MODEL_CATEGORY MC ON M.MODEL_CATEGORY_ID = MC.ID
-            JOIN MODEL_TYPE MT ON M.MODEL_TYPE_ID = MT.ID
-            WHERE M.ENABLED = TRUE"""
-        )
-        models = dict()
-        for row in cursor.fetchall():
-            model_type_enum = ModelCategory[row["CATEGORY"]].value
-            models[row["ID"]] = Model(
-                category=ModelCategory[row["CATEGORY"]],
-                type=cast(
-                    ValidationModelType | ProcessingModelType,
-                    model_type_enum[row["TYPE"]],
-                ),
-                subtype=row["SUBTYPE"],
-                module=row["MODULE"],
-                class_name=row["CLASS"],
+        if not rows:
+            return
+        cases = " ".join(["WHEN %s THEN %s"] * len(rows))
+        assignments = ", ".join(f"{column} = CASE ID {cases} END" for column in columns)
+        ids = ", ".join(["%s"] * len(rows))
+        params = [
+            param
+            for index in range(1, len(columns) + 1)
+            for row in rows
+            for param in (row[0], row[index])
+        ]
+        params.extend(row[0] for row in rows)
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                f"""UPDATE {table_name}
+                SET {assignments},
+                PROCESSED_AT = NOW()
+                WHERE ID IN ({ids})""",
+                params,
             )
-        cursor.close()
+
+    def update_classification_reports(self, rows: list[tuple[int, int, int]]):
+        self._update_many("CLASSIFICATION_REPORT", ("DISEASE_ID", "SEVERITY_ID"), rows)
+
+    def update_segmentation_reports(self, rows: list[tuple[int, float, int]]):
+        self._update_many("SEGMENTATION_REPORT", ("STRESS_RATIO", "SEVERITY_ID"), rows)
+
+    def _get_enabled_models(self) -> dict[int, Model]:
+        if self._pool.pool_name in _enabled_models:
+            return _enabled_models[self._pool.pool_name]
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """SELECT M.ID,
+                MC.NAME,
+                MT.NAME,
+                M.SUBTYPE,
+                M.MODULE,
+                M.CLASS
+                FROM MODEL M
+                JOIN MODEL_CATEGORY MC ON M.MODEL_CATEGORY_ID = MC.ID
+                JOIN MODEL_TYPE MT ON M.MODEL_TYPE_ID = MT.ID
+                WHERE M.ENABLED = TRUE"""
+            )
+            models = {
+                model_id: Model(
+                    category=(category := ModelCategory[category_name]),
+                    type=category.value[type_name],
+                    subtype=subtype,
+                    module=module,
+                    class_name=class_name,
+                )
+                for model_id, category_name, type_name, subtype, module, class_name in cursor.fetchall()
+            }
+        _enabled_models[self._pool.pool_name] = models
         return models
 
+    def invalidate_model_cache(self):
+        super().invalidate_model_cache()
+        _enabled_models.pop(self._pool.pool_name, None)
+
     def _get_dict_from_database(
         self, table_name: str, key_column: str, value_column: str
     ) -> dict:
         """Get a dictionary from the database.
 
+        The dictionary is read once per database and shared by all the
+        instances connected to it.
+
         Parameters
         ----------
         table_name : str
@@ -133,25 +148,21 @@ class MySQLDatabase(Database):
         dict
             Key-value pairs.
         """
-        cursor = self._get_cursor()
-        cursor.execute(f"SELECT {key_column}, {value_column} FROM {table_name}")
-        result_dict = dict()
-        for row in cursor.fetchall():
-            result_dict[row[0]] = row[1]
-        cursor.close()
-        return result_dict
-
-    @property
-    def model_category_dict(self) -> dict[str, int]:
-        return self._model_category_dict
-
-    @property
-    def model_type_dict(self) -> dict[str, int]:
-        return self._model_type_dict
-
-    @property
-    def enabled_models(self) -> dict[int, Model]:
-        return self._enabled_models
+        key = (self._pool.pool_name, table_name, key_column, value_column)
+        if key not in _lookup_tables:
+            with (
+                pooled_connection(self._pool) as connection,
+                connection.cursor() as cursor,
+            ):
+                cursor.execute(f"SELECT {key_column}, {value_column} FROM {table_name}")
+                _lookup_tables[key] = dict(cursor.fetchall())
+        return _lookup_tables[key]
+
+    def _get_model_category_dict(self) -> dict[str, int]:
+        return self._get_dict_from_database("MODEL_CATEGORY", "NAME", "ID")
+
+    def _get_model_type_dict(self) -> dict[str, int]:
+        return self._get_dict_from_database("MODEL_TYPE", "NAME", "ID")
 
     def _insert_model(
         self,
@@ -163,76 +174,97 @@ class MySQLDatabase(Database):
         version: str,
         enabled: bool,
     ) -> int:
-        cursor = self._get_cursor()
         model_category_id = self.model_category_dict[model_category.name]
         type_id = self.model_type_dict[model_type.name]
-        cursor.execute(
-            """INSERT INTO MODEL
-            (MODEL_CATEGORY_ID, MODEL_TYPE_ID, SUBTYPE, MODULE, CLASS, VERSION, ENABLED)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-            (model_category_id, type_id, subtype, module, class_name, version, enabled),
-        )
-        self.connection.commit()
-        model_id: int = cursor.lastrowid
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO MODEL
+                (MODEL_CATEGORY_ID, MODEL_TYPE_ID, SUBTYPE, MODULE, CLASS, VERSION, ENABLED)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                (
+                    model_category_id,
+                    type_id,
+                    subtype,
+                    module,
+                    class_name,
+                    version,
+                    enabled,
+                ),
+            )
+            model_id: int = cursor.lastrowid
         return model_id
 
     def insert_classification_report(
         self, user_id: int, image_id: int, model_id: int
     ) -> int:
-        cursor = self._get_cursor()
-        cursor.execute(
-            """INSERT INTO CLASSIFICATION_REPORT
-            (USER_ID, IMAGE_ID, MODEL_ID)
-            VALUES (%s, %s, %s)""",
-            (user_id, image_id, model_id),
-        )
-        self.connection.commit()
-        report_id: int = cursor.lastrowid
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO CLASSIFICATION_REPORT
+                (USER_ID, IMAGE_ID, MODEL_ID)
+                VALUES (%s, %s, %s)""",
+                (user_id, image_id, model_id),
+            )
+            report_id: int = cursor.lastrowid
         return report_id
 
     def insert_segmentation_report(
         self, user_id: int, image_id: int, model_id: int, has_mask: bool = False
     ) -> int:
-        cursor = self.connection.cursor()
-        cursor.execute(
-            """INSERT INTO SEGMENTATION_REPORT
-            (USER_ID, IMAGE_ID, MODEL_ID, HAS_MASK)
-            VALUES (%s, %s, %s, %s)""",
-            (user_id, image_id, model_id, has_mask),
-        )
-        self.connection.commit()
-        report_id: int = cast(int, cursor.lastrowid)
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO SEGMENTATION_REPORT
+                (USER_ID, IMAGE_ID, MODEL_ID, HAS_MASK)
+                VALUES (%s, %s, %s, %s)""",
+                (user_id, image_id, model_id, has_mask),
+            )
+            report_id: int = cast(int, cursor.lastrowid)
         return report_id
 
     def insert_image(self, user_id: int, filename: str) -> int:
-        cursor = self._get_cursor()
-        cursor.execute(
-            """INSERT INTO IMAGE
-            (USER_ID, FILENAME)
-            VALUES (%s, %s)""",
-            (user_id, filename),
-        )
-        self.connection.commit()
-        image_id: int = cursor.lastrowid
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO IMAGE
+                (USER_ID, FILENAME)
+                VALUES (%s, %s)""",
+                (user_id, filename),
+            )
+            image_id: int = cursor.lastrowid
         return image_id
 
+    def _insert_report_bundle(
+        self,
+        user_id: int,
+        filename: str,
+        model_id: int,
+        report_type: ProcessingModelType,
+        has_mask: bool,
+    ) -> tuple[int, int]:
+        report_id: int
+        with self.transaction():
+            image_id = self.insert_image(user_id, filename)
+            match report_type:
+                case ProcessingModelType.CLASSIFICATION:
+                    report_id = self.insert_classification_report(
+                        user_id, image_id, model_id
+                    )
+                case ProcessingModelType.SEGMENTATION:
+                    report_id = self.insert_segmentation_report(
+                        user_id, image_id, model_id, has_mask
+                    )
+        return image_id, report_id
+
     def update_report_validity(
         self, report_id: int, report_type: ProcessingModelType, valid: bool
     ):
-        cursor = self._get_cursor()
-        match report_type:
-            case ProcessingModelType.CLASSIFICATION:
-                report_table = "CLASSIFICATION_REPORT"
-            case ProcessingModelType.SEGMENTATION:
-                report_table = "SEGMENTATION_REPORT"
-            case _:
-                raise ValueError(f"Invalid report type: {report_type}")
-        cursor.execute(
-            f"UPDATE {report_table} SET VALID = %s WHERE ID = %s", (valid, report_id)
-        )
-        self.connection.commit()
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            match report_type:
+                case ProcessingModelType.CLASSIFICATION:
+                    report_table = "CLASSIFICATION_REPORT"
+                case ProcessingModelType.SEGMENTATION:
+                    report_table = "SEGMENTATION_REPORT"
+                case _:
+                    raise ValueError(f"Invalid report type: {report_type}")
+            cursor.execute(
+                f"UPDATE {report_table} SET VALID = %s WHERE ID = %s",
+                (valid, report_id),
+            )
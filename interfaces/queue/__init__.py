@@ -1,10 +1,16 @@
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from time import monotonic, sleep
 
 from models.processing import ProcessingModelType
 
 from .. import Interface
 
+MIN_WAIT_INTERVAL = 0.01
+
+_CLASSIFICATION = ProcessingModelType.CLASSIFICATION
+_SEGMENTATION = ProcessingModelType.SEGMENTATION
+
 
 @dataclass
 class QueueElement:
@@ -16,6 +22,7 @@ class QueueElement:
     report_type: ProcessingModelType
     image: bytes
     generate_mask: bool = False
+    image_id: int | None = None
 
 
 class Queue(Interface, ABC):
@@ -108,6 +115,17 @@ class Queue(Interface, ABC):
         """
         pass
 
+    @abstractmethod
+    def requeue_to_processing_queue(self, element: QueueElement):
+        """Put an element dequeued from the processing queue back, at its front if possible.
+
+        Parameters
+        ----------
+        element : QueueElement
+            Element dequeued but not processed.
+        """
+        pass
+
     @abstractmethod
     def processing_queue_has_elements(self) -> bool:
         """Check if the queue has elements.
@@ -211,6 +229,17 @@ class Queue(Interface, ABC):
         """
         pass
 
+    @abstractmethod
+    def requeue_to_validation_queue(self, element: QueueElement):
+        """Put an element dequeued from the validation queue back, at its front if possible.
+
+        Parameters
+        ----------
+        element : QueueElement
+            Element dequeued but not validated.
+        """
+        pass
+
     @abstractmethod
     def validation_queue_has_elements(self) -> bool:
         """Check if the validation queue has elements.
@@ -222,6 +251,50 @@ class Queue(Interface, ABC):
         """
         pass
 
+    def wait_for_work(
+        self,
+        max_interval: float,
+        processing: bool = True,
+        validation: bool = True,
+        timeout: float | None = None,
+    ) -> bool:
+        """Wait until a queue has elements.
+
+        The queues are probed with an interval doubling from 10 ms up to the
+        maximum interval, so elements enqueued shortly after the queues run
+        empty are picked up quickly, while idle queues are probed rarely.
+
+        Parameters
+        ----------
+        max_interval : float
+            Maximum interval between probes, in seconds.
+        processing : bool, optional
+            Indicates if the processing queue should be probed, by default True.
+        validation : bool, optional
+            Indicates if the validation queue should be probed, by default True.
+        timeout : float | None, optional
+            Maximum time to wait, in seconds, by default None (no limit).
+
+        Returns
+        -------
+        bool
+            True if a queue has elements, False if the timeout expired.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        interval = min(MIN_WAIT_INTERVAL, max_interval)
+        while True:
+            if (validation and self.validation_queue_has_elements()) or (
+                processing and self.processing_queue_has_elements()
+            ):
+                return True
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+                interval = min(interval, remaining)
+            sleep(interval)
+            interval = min(interval * 2, max_interval)
+
     @abstractmethod
     def update_buffer(self, element_id: int, validation_result: bool):
         """Update the buffer.
@@ -237,33 +310,31 @@ class Queue(Interface, ABC):
 
     @staticmethod
     def process_report_id(
-        classification_report_id: int, segmentation_report_id: int
+        classification_report_id: int | None, segmentation_report_id: int | None
     ) -> tuple[int, ProcessingModelType]:
         """Process the report ID.
 
         Parameters
         ----------
-        classification_report_id : int
+        classification_report_id : int | None
             Classification report ID.
-        segmentation_report_id : int
+        segmentation_report_id : int | None
             Segmentation report ID.
 
         Returns
         -------
         tuple[int, ProcessingModelType]
             Report ID and report type.
+
+        Raises
+        ------
+        ValueError
+            If there is no report ID or there are both report IDs.
         """
-        report_id: int
-        report_type: ProcessingModelType
-        match (classification_report_id, segmentation_report_id):
-            case (classification_report_id, None):
-                report_id = classification_report_id
-                report_type = ProcessingModelType.CLASSIFICATION
-            case (None, segmentation_report_id):
-                report_id = segmentation_report_id
-                report_type = ProcessingModelType.SEGMENTATION
-            case (None, None):
+        if segmentation_report_id is None:
+            if classification_report_id is None:
                 raise ValueError("No report ID found")
-            case (_, _):
-                raise ValueError("Multiple report IDs found")
-        return report_id, report_type
+            return classification_report_id, _CLASSIFICATION
+        if classification_report_id is None:
+            return segmentation_report_id, _SEGMENTATION
+        raise ValueError("Multiple report IDs found")
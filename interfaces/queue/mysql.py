@@ -1,34 +1,48 @@
-import mysql.connector
+from mysql.connector import errorcode
+from mysql.connector.errors import IntegrityError
 
 from models import ProcessingModelType
 
+from .._compression import compress, decompress
+from .._mysql import MySQLInterface, get_pool, pooled_connection
 from . import Queue, QueueElement
 
 
-class MySQLQueue(Queue):
+class MySQLQueue(MySQLInterface, Queue):
     def __init__(self, module_settings: dict):
-        self.connection = mysql.connector.connect(
-            host=module_settings["host"],
-            port=module_settings["port"],
-            user=module_settings["user"],
-            password=module_settings["password"],
-            database=module_settings["database"],
-        )
-        cursor = self.connection.cursor()
-        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
-        cursor.close()
+        self._pool = get_pool(module_settings)
+        self._compress = module_settings.get("compress", False)
+
+    @staticmethod
+    def _split_report_id(
+        model_type: ProcessingModelType, report_id: int
+    ) -> tuple[int | None, int | None]:
+        """Split a report ID into the classification and segmentation report ID columns.
 
-    def _get_cursor(self, *args, **kwargs):
-        """Get a cursor ensuring the connection is active.
+        Parameters
+        ----------
+        model_type : ProcessingModelType
+            Model type.
+        report_id : int
+            Report ID.
 
         Returns
         -------
-        MySQLCursorAbstract
-            Cursor.
+        tuple[int | None, int | None]
+            Classification report ID and segmentation report ID.
+
+        Raises
+        ------
+        ValueError
+            If the model type is invalid.
         """
-        if not self.connection.is_connected():
-            self.connection.reconnect()
-        return self.connection.cursor(*args, **kwargs)
+        match model_type:
+            case ProcessingModelType.CLASSIFICATION:
+                return report_id, None
+            case ProcessingModelType.SEGMENTATION:
+                return None, report_id
+            case _:
+                raise ValueError(f"Invalid model type: {model_type}")
 
     def _enqueue_to_processing_queue(
         self,
@@ -39,78 +53,128 @@ class MySQLQueue(Queue):
         image: bytes,
         generate_mask: bool | None = None,
     ):
-        cursor = self._get_cursor()
-        classification_report_id: int | None
-        segmentation_report_id: int | None
-        match model_type:
-            case ProcessingModelType.CLASSIFICATION:
-                classification_report_id = report_id
-                segmentation_report_id = None
-            case ProcessingModelType.SEGMENTATION:
-                classification_report_id = None
-                segmentation_report_id = report_id
-            case _:
-                raise ValueError(f"Invalid model type: {model_type}")
-        cursor.execute(
-            """INSERT INTO VALIDATION_QUEUE
-            (IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
-            VALUES (%s, %s, %s, %s, %s, %s)""",
-            (
-                image_id,
-                model_id,
-                classification_report_id,
-                segmentation_report_id,
-                image,
-                generate_mask,
-            ),
-        )
-        self.connection.commit()
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO PROCESSING_QUEUE
+                (IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                VALUES (%s, %s, %s, %s, %s, %s)""",
+                (
+                    image_id,
+                    model_id,
+                    *self._split_report_id(model_type, report_id),
+                    compress(image) if self._compress else image,
+                    generate_mask,
+                ),
+            )
+
+    @staticmethod
+    def _dequeue(cursor, operation: str) -> tuple | None:
+        """Run a multi-statement dequeue in a single round trip.
+
+        Parameters
+        ----------
+        cursor : MySQLCursorAbstract
+            Cursor.
+        operation : str
+            Statements claiming, reading and deleting the first element.
+
+        Returns
+        -------
+        tuple | None
+            The row read by the operation, or None if the queue is empty.
+        """
+        row = None
+        for result in cursor.execute(operation, multi=True):
+            if result.with_rows:
+                rows = result.fetchall()
+                row = rows[0] if rows else None
+        return row
 
     def dequeue_from_processing_queue(self) -> QueueElement | None:
-        cursor = self._get_cursor(dictionary=True)
-        cursor.execute("LOCK TABLE PROCESSING_QUEUE WRITE")
-        cursor.execute(
-            """SELECT ID,
-            MODEL_ID,
-            CLASSIFICATION_REPORT_ID,
-            SEGMENTATION_REPORT_ID,
-            IMAGE,
-            GENERATE_MASK
-            FROM PROCESSING_QUEUE
-            ORDER BY ID ASC
-            LIMIT 1"""
-        )
-        row = cursor.fetchone()
+        with (
+            pooled_connection(self._pool) as connection,
+            connection.cursor() as cursor,
+        ):
+            # The claimed row stays locked until the final commit, so concurrent
+            # consumers skip it instead of waiting. The claim only reads the
+            # primary key, so the image, stored off-page, is read once, by the
+            # consumer that claimed the row.
+            row = self._dequeue(
+                cursor,
+                """START TRANSACTION;
+                SET @DEQUEUED_ID = NULL;
+                SELECT ID INTO @DEQUEUED_ID
+                FROM PROCESSING_QUEUE
+                ORDER BY ID ASC
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED;
+                SELECT ID,
+                IMAGE_ID,
+                MODEL_ID,
+                CLASSIFICATION_REPORT_ID,
+                SEGMENTATION_REPORT_ID,
+                IMAGE,
+                GENERATE_MASK
+                FROM PROCESSING_QUEUE
+                WHERE ID = @DEQUEUED_ID;
+                DELETE FROM PROCESSING_QUEUE WHERE ID = @DEQUEUED_ID;
+                COMMIT""",
+            )
         if row is None:
-            cursor.execute("UNLOCK TABLES")
-            cursor.close()
             return None
-        cursor.execute(
-            "DELETE FROM PROCESSING_QUEUE WHERE ID = %s",
-            (row["ID"],),
-        )
-        self.connection.commit()
-        cursor.execute("UNLOCK TABLES")
-        cursor.close()
-        report_id, report_type = self.process_report_id(
-            row["CLASSIFICATION_REPORT_ID"], row["SEGMENTATION_REPORT_ID"]
-        )
+        (
+            element_id,
+            image_id,
+            model_id,
+            classification_report_id,
+            segmentation_report_id,
+            image,
+            generate_mask,
+        ) = row
         return QueueElement(
-            row["ID"],
-            row["MODEL_ID"],
-            report_id,
-            report_type,
-            row["IMAGE"],
-            row["GENERATE_MASK"],
+            element_id,
+            model_id,
+            *self.process_report_id(classification_report_id, segmentation_report_id),
+            decompress(image),
+            generate_mask,
+            image_id,
         )
 
+    def requeue_to_processing_queue(self, element: QueueElement):
+        row = (
+            element.image_id,
+            element.model_id,
+            *self._split_report_id(element.report_type, element.report_id),
+            compress(element.image) if self._compress else element.image,
+            element.generate_mask,
+        )
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            try:
+                # The element takes its original ID, and with it its place in
+                # the queue, back.
+                cursor.execute(
+                    """INSERT INTO PROCESSING_QUEUE
+                    (ID, IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                    (element.id, *row),
+                )
+            except IntegrityError as e:
+                # The ID was assigned again, e.g. after a restart of a server
+                # older than MySQL 8.0 reset the counter to MAX(ID) + 1.
+                if e.errno != errorcode.ER_DUP_ENTRY:
+                    raise
+                cursor.execute(
+                    """INSERT INTO PROCESSING_QUEUE
+                    (IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                    VALUES (%s, %s, %s, %s, %s, %s)""",
+                    row,
+                )
+
     def processing_queue_has_elements(self) -> bool:
-        cursor = self._get_cursor()
-        cursor.execute("SELECT COUNT(*) FROM PROCESSING_QUEUE")
-        result = cursor.fetchone()
-        cursor.close()
-        return result[0] > 0
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM PROCESSING_QUEUE)")
+            result = cursor.fetchone()
+        return bool(result[0])
 
     def _enqueue_to_validation_queue(
         self,
@@ -122,96 +186,128 @@ class MySQLQueue(Queue):
         image: bytes,
         generate_mask: bool | None = None,
     ):
-        cursor = self._get_cursor()
-        classification_report_id: int | None
-        segmentation_report_id: int | None
-        match model_type:
-            case ProcessingModelType.CLASSIFICATION:
-                classification_report_id = report_id
-                segmentation_report_id = None
-            case ProcessingModelType.SEGMENTATION:
-                classification_report_id = None
-                segmentation_report_id = report_id
-            case _:
-                raise ValueError(f"Invalid model type: {model_type}")
-        cursor.execute(
-            """INSERT INTO VALIDATION_QUEUE
-            (IMAGE_ID, VALIDATION_MODEL_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-            (
-                image_id,
-                validation_model_id,
-                model_id,
-                classification_report_id,
-                segmentation_report_id,
-                image,
-                generate_mask,
-            ),
-        )
-        self.connection.commit()
-        cursor.close()
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO VALIDATION_QUEUE
+                (IMAGE_ID, VALIDATION_MODEL_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                (
+                    image_id,
+                    validation_model_id,
+                    model_id,
+                    *self._split_report_id(model_type, report_id),
+                    compress(image) if self._compress else image,
+                    generate_mask,
+                ),
+            )
 
     def dequeue_from_validation_queue(self) -> QueueElement | None:
-        cursor = self._get_cursor(dictionary=True)
-        cursor.execute("LOCK TABLES VALIDATION_QUEUE WRITE, BUFFER WRITE")
-        cursor.execute(
-            """SELECT ID,
-            VALIDATION_MODEL_ID,
-            CLASSIFICATION_REPORT_ID,
-            SEGMENTATION_REPORT_ID,
-            IMAGE
-            FROM VALIDATION_QUEUE
-            ORDER BY ID ASC
-            LIMIT 1"""
-        )
-        row = cursor.fetchone()
+        with (
+            pooled_connection(self._pool) as connection,
+            connection.cursor() as cursor,
+        ):
+            # The claimed row stays locked until the final commit, so concurrent
+            # consumers skip it instead of waiting. The claim only reads the
+            # primary key, so the image, stored off-page, is read once, by the
+            # consumer that claimed the row.
+            row = self._dequeue(
+                cursor,
+                """START TRANSACTION;
+                SET @DEQUEUED_ID = NULL;
+                SELECT ID INTO @DEQUEUED_ID
+                FROM VALIDATION_QUEUE
+                ORDER BY ID ASC
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED;
+                SELECT ID,
+                VALIDATION_MODEL_ID,
+                CLASSIFICATION_REPORT_ID,
+                SEGMENTATION_REPORT_ID,
+                IMAGE
+                FROM VALIDATION_QUEUE
+                WHERE ID = @DEQUEUED_ID;
+                INSERT INTO BUFFER
+                (ID, IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                SELECT ID, IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK
+                FROM VALIDATION_QUEUE
+                WHERE ID = @DEQUEUED_ID;
+                DELETE FROM VALIDATION_QUEUE WHERE ID = @DEQUEUED_ID;
+                COMMIT""",
+            )
         if row is None:
-            cursor.execute("UNLOCK TABLES")
-            cursor.close()
             return None
-        cursor.execute(
-            """INSERT INTO BUFFER
-            (ID, IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
-            SELECT ID, IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK
-            FROM VALIDATION_QUEUE
-            WHERE ID = %s""",
-            (row["ID"],),
-        )
-        cursor.execute(
-            "DELETE FROM VALIDATION_QUEUE WHERE ID = %s",
-            (row["ID"],),
-        )
-        self.connection.commit()
-        cursor.execute("UNLOCK TABLES")
-        cursor.close()
-        report_id, report_type = self.process_report_id(
-            row["CLASSIFICATION_REPORT_ID"], row["SEGMENTATION_REPORT_ID"]
-        )
+        (
+            element_id,
+            model_id,
+            classification_report_id,
+            segmentation_report_id,
+            image,
+        ) = row
         return QueueElement(
-            row["ID"], row["VALIDATION_MODEL_ID"], report_id, report_type, row["IMAGE"]
+            element_id,
+            model_id,
+            *self.process_report_id(classification_report_id, segmentation_report_id),
+            decompress(image),
         )
 
+    def requeue_to_validation_queue(self, element: QueueElement):
+        # The dequeue moved the row to the buffer under the same ID, without
+        # the validation model ID, which the element holds.
+        with (
+            self.transaction(),
+            pooled_connection(self._pool) as connection,
+            connection.cursor() as cursor,
+        ):
+            try:
+                cursor.execute(
+                    """INSERT INTO VALIDATION_QUEUE
+                    (ID, IMAGE_ID, VALIDATION_MODEL_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                    SELECT ID, IMAGE_ID, %s, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK
+                    FROM BUFFER
+                    WHERE ID = %s""",
+                    (element.model_id, element.id),
+                )
+            except IntegrityError as e:
+                # The ID was assigned again, e.g. after a restart of a server
+                # older than MySQL 8.0 reset the counter to MAX(ID) + 1. Only
+                # the failed statement is rolled back.
+                if e.errno != errorcode.ER_DUP_ENTRY:
+                    raise
+                cursor.execute(
+                    """INSERT INTO VALIDATION_QUEUE
+                    (IMAGE_ID, VALIDATION_MODEL_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                    SELECT IMAGE_ID, %s, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK
+                    FROM BUFFER
+                    WHERE ID = %s""",
+                    (element.model_id, element.id),
+                )
+            cursor.execute(
+                "DELETE FROM BUFFER WHERE ID = %s",
+                (element.id,),
+            )
+
     def update_buffer(self, element_id: int, validation_result: bool):
-        cursor = self._get_cursor()
-        if validation_result:
+        with (
+            self.transaction(),
+            pooled_connection(self._pool) as connection,
+            connection.cursor() as cursor,
+        ):
+            if validation_result:
+                cursor.execute(
+                    """INSERT INTO PROCESSING_QUEUE
+                    (IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
+                    SELECT IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK
+                    FROM BUFFER
+                    WHERE ID = %s""",
+                    (element_id,),
+                )
             cursor.execute(
-                """INSERT INTO PROCESSING_QUEUE
-                (IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK)
-                SELECT IMAGE_ID, MODEL_ID, CLASSIFICATION_REPORT_ID, SEGMENTATION_REPORT_ID, IMAGE, GENERATE_MASK
-                FROM BUFFER
-                WHERE ID = %s""",
+                "DELETE FROM BUFFER WHERE ID = %s",
                 (element_id,),
             )
-        cursor.execute(
-            "DELETE FROM BUFFER WHERE ID = %s",
-            (element_id,),
-        )
-        self.connection.commit()
-        cursor.close()
 
     def validation_queue_has_elements(self) -> bool:
-        cursor = self._get_cursor()
-        cursor.execute("SELECT COUNT(*) FROM VALIDATION_QUEUE")
-        result = cursor.fetchone()
-        cursor.close()
-        return result[0] > 0
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM VALIDATION_QUEUE)")
+            result = cursor.fetchone()
+        return bool(result[0])
@@ -1,4 +1,9 @@
+import os
+import shutil
+import tempfile
 from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import BinaryIO
 
 from .. import Interface
 
@@ -12,13 +17,53 @@ class Storage(Interface, ABC):
         Abstract base class.
     """
 
+    _cache_dir: Path | None = None
+    concurrent_retrievals: int = 1
+    """Maximum number of weights retrieved at the same time."""
+
     @abstractmethod
     def __init__(self, module_settings: dict):
         pass
 
+    def retrieve_weights(self, model_id: int) -> BinaryIO:
+        """Template method to retrieve the weights of a model.
+
+        If the storage has a cache directory, the weights are read from it,
+        and retrieved from the storage and written to it on a miss. The
+        weights of a model never change, so cached weights stay valid.
+
+        Parameters
+        ----------
+        model_id : int
+            Model ID.
+
+        Returns
+        -------
+        BinaryIO
+            Stream of the weights, to be closed by the caller.
+        """
+        if self._cache_dir is None:
+            return self._retrieve_weights(model_id)
+        path = self._cache_dir / f"weights_{model_id}"
+        if not path.exists():
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            # Written to a temporary file first, so concurrent readers never
+            # see partially written weights.
+            with tempfile.NamedTemporaryFile(
+                dir=self._cache_dir, delete=False
+            ) as cached:
+                try:
+                    with self._retrieve_weights(model_id) as weights:
+                        shutil.copyfileobj(weights, cached)
+                except BaseException:
+                    os.unlink(cached.name)
+                    raise
+            os.replace(cached.name, path)
+        return path.open("rb")
+
     @abstractmethod
-    def retrieve_weights(self, model_id: int) -> bytes:
-        """Retrieve the weights of a model.
+    def _retrieve_weights(self, model_id: int) -> BinaryIO:
+        """Retrieve the weights of a model from the storage.
 
         Parameters
         ----------
@@ -27,8 +72,8 @@ class Storage(Interface, ABC):
 
         Returns
         -------
-        bytes
-            Weights.
+        BinaryIO
+            Stream of the weights, to be closed by the caller.
         """
         pass
 
@@ -46,13 +91,13 @@ class Storage(Interface, ABC):
         pass
 
     @abstractmethod
-    def store_weights(self, weights: bytes, model_id: int):
+    def store_weights(self, weights: BinaryIO, model_id: int):
         """Store the weights of a model.
 
         Parameters
         ----------
-        weights : bytes
-            Weights.
+        weights : BinaryIO
+            Stream of the weights, read until its end.
         model_id : int
             Model ID.
         """
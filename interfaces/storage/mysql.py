@@ -1,69 +1,104 @@
-import mysql.connector
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator
 
+from .._compression import compress
+from .._mysql import MySQLInterface, get_pool, pooled_connection
 from . import Storage
 
+WEIGHTS_CHUNK_SIZE = 4 << 20
 
-class MySQLStorage(Storage):
-    def __init__(self, module_settings: dict):
-        self.connection = mysql.connector.connect(
-            host=module_settings["host"],
-            port=module_settings["port"],
-            user=module_settings["user"],
-            password=module_settings["password"],
-            database=module_settings["database"],
-        )
-        cursor = self.connection.cursor()
-        cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED")
-        cursor.close()
 
-    def _get_cursor(self, *args, **kwargs):
-        """Get a cursor ensuring the connection is active.
-
-        Returns
-        -------
-        MySQLCursorAbstract
-            Cursor.
-        """
-        if not self.connection.is_connected():
-            self.connection.reconnect()
-        return self.connection.cursor(*args, **kwargs)
+class MySQLStorage(MySQLInterface, Storage):
+    def __init__(self, module_settings: dict):
+        self._module_settings = module_settings
+        self._pool = get_pool(module_settings)
+        # Exhausted pools raise instead of waiting for a connection.
+        self.concurrent_retrievals = self._pool.pool_size
+        self._compress = module_settings.get("compress", False)
+        if "cache_dir" in module_settings:
+            self._cache_dir = Path(module_settings["cache_dir"])
 
     def store_mask(self, mask: bytes, report_id: int):
-        cursor = self._get_cursor()
-        cursor.execute(
+        if self._compress:
+            mask = compress(mask)
+        self._execute_prepared(
             """INSERT INTO MASK
             (ID, DATA) VALUES (%s, %s)""",
             (report_id, mask),
         )
-        self.connection.commit()
-        cursor.close()
 
-    def retrieve_weights(self, model_id: int) -> bytes:
-        cursor = self._get_cursor()
-        cursor.execute(
-            "SELECT W.DATA FROM WEIGHTS W WHERE W.ID = %s",
-            (model_id,),
-        )
-        weights = cursor.fetchone()[0]
-        cursor.close()
+    def retrieve_weights_chunks(
+        self, model_id: int, chunk_size: int = WEIGHTS_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Retrieve the weights of a model in chunks.
+
+        Each chunk is read with its own query, so at most one chunk of the
+        weights is held in memory at a time.
+
+        Parameters
+        ----------
+        model_id : int
+            Model ID.
+        chunk_size : int, optional
+            Maximum size of a chunk in bytes, by default 4 MiB.
+
+        Yields
+        ------
+        bytes
+            Chunk of the weights.
+
+        Raises
+        ------
+        ValueError
+            If the model has no weights.
+        """
+        with pooled_connection(self._pool) as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT OCTET_LENGTH(W.DATA) FROM WEIGHTS W WHERE W.ID = %s",
+                (model_id,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"No weights for model {model_id}")
+            for offset in range(0, row[0], chunk_size):
+                # SUBSTRING positions start at 1.
+                cursor.execute(
+                    "SELECT SUBSTRING(W.DATA, %s, %s) FROM WEIGHTS W WHERE W.ID = %s",
+                    (offset + 1, chunk_size, model_id),
+                )
+                yield cursor.fetchone()[0]
+
+    def _retrieve_weights(self, model_id: int) -> BinaryIO:
+        weights = tempfile.TemporaryFile()
+        try:
+            for chunk in self.retrieve_weights_chunks(model_id):
+                weights.write(chunk)
+        except BaseException:
+            weights.close()
+            raise
+        weights.seek(0)
         return weights
 
-    def store_weights(self, weights: bytes, model_id: int):
-        cursor = self._get_cursor()
-        cursor.execute(
-            """INSERT INTO WEIGHTS
-            (ID, DATA) VALUES (%s, %s)""",
-            (model_id, weights),
-        )
-        self.connection.commit()
-        cursor.close()
+    def store_weights(self, weights: BinaryIO, model_id: int):
+        # Streaming parameters of prepared statements is only supported by the
+        # pure Python implementation, so the weights are stored through a
+        # single connection pool of their own.
+        pool = get_pool({**self._module_settings, "pool_size": 1}, use_pure=True)
+        with pooled_connection(pool) as connection, connection.cursor(
+            prepared=True
+        ) as cursor:
+            cursor.execute(
+                """INSERT INTO WEIGHTS
+                (ID, DATA) VALUES (%s, %s)""",
+                (model_id, weights),
+            )
 
     def store_image(self, image: bytes, image_id: int):
-        cursor = self._get_cursor()
-        cursor.execute(
+        if self._compress:
+            image = compress(image)
+        self._execute_prepared(
             """INSERT INTO IMAGE
             (ID, DATA) VALUES (%s, %s)""",
             (image_id, image),
         )
-        self.connection.commit()
-        cursor.close()
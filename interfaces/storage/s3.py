@@ -0,0 +1,83 @@
+import tempfile
+from pathlib import Path
+from typing import BinaryIO
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+from .._compression import compress
+from . import Storage
+
+TRANSFER_CHUNK_SIZE = 8 << 20
+CONCURRENT_RETRIEVALS = 4
+
+
+class S3Storage(Storage):
+    """Implementation of the storage interface for S3 compatible object storage.
+
+    Weights, masks and images are stored as objects named after their ID, under
+    the weights/, masks/ and images/ prefixes of a bucket. Weights are uploaded
+    and downloaded in parallel parts.
+
+    Parameters
+    ----------
+    Storage : _abc.ABCMeta
+        Abstract base class.
+    """
+
+    def __init__(self, module_settings: dict):
+        self._bucket = module_settings["bucket"]
+        self._compress = module_settings.get("compress", False)
+        if "cache_dir" in module_settings:
+            self._cache_dir = Path(module_settings["cache_dir"])
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=module_settings.get("endpoint_url"),
+            region_name=module_settings.get("region"),
+            aws_access_key_id=module_settings.get("access_key_id"),
+            aws_secret_access_key=module_settings.get("secret_access_key"),
+            config=Config(max_pool_connections=64, tcp_keepalive=True),
+        )
+        self._transfer_config = TransferConfig(
+            multipart_chunksize=TRANSFER_CHUNK_SIZE,
+            max_concurrency=module_settings.get("max_concurrency", 8),
+        )
+        self.concurrent_retrievals = CONCURRENT_RETRIEVALS
+
+    def _retrieve_weights(self, model_id: int) -> BinaryIO:
+        weights = tempfile.TemporaryFile()
+        try:
+            self._client.download_fileobj(
+                self._bucket,
+                f"weights/{model_id}",
+                weights,
+                Config=self._transfer_config,
+            )
+        except BaseException:
+            weights.close()
+            raise
+        weights.seek(0)
+        return weights
+
+    def store_mask(self, mask: bytes, report_id: int):
+        if self._compress:
+            mask = compress(mask)
+        self._client.put_object(
+            Bucket=self._bucket, Key=f"masks/{report_id}", Body=mask
+        )
+
+    def store_weights(self, weights: BinaryIO, model_id: int):
+        self._client.upload_fileobj(
+            weights,
+            self._bucket,
+            f"weights/{model_id}",
+            Config=self._transfer_config,
+        )
+
+    def store_image(self, image: bytes, image_id: int):
+        if self._compress:
+            image = compress(image)
+        self._client.put_object(
+            Bucket=self._bucket, Key=f"images/{image_id}", Body=image
+        )
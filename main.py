@@ -1,16 +1,22 @@
-import tomllib
+import os
+import sys
+import warnings
 from argparse import ArgumentParser
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import closing
 from enum import Enum, auto
-from time import sleep
-from typing import Callable
+from itertools import batched
+from typing import BinaryIO, Callable, Generator, Mapping
 
+from config import load_settings
 from core import ModelWrapper
 from core.processing.classification import Classification
 from core.processing.segmentation import Segmentation
+from core.registry import ModelRegistry
 from core.validation.coffee_leaf_occ import CoffeeLeafOCC
 from interfaces import InterfaceFactory
 from interfaces.database import Database
-from interfaces.queue import Queue
+from interfaces.queue import Queue, QueueElement
 from interfaces.storage import Storage
 from models import Model, ModelCategory
 from models.processing import ProcessingModelType
@@ -34,7 +40,7 @@ def cli():
     parser = ArgumentParser()
     parser.add_argument(
         "settings",
-        type=lambda x: tomllib.load(open(x, "rb")),
+        type=load_settings,
         help="Path to the settings file",
     )
     parser.add_argument(
@@ -46,15 +52,17 @@ def cli():
     return parser.parse_args()
 
 
-def load_validation_model(model: Model, weights: bytes) -> ModelWrapper:
+def load_validation_model(model: Model, weights: BinaryIO, **kwargs) -> ModelWrapper:
     """Load a validation model.
 
     Parameters
     ----------
     model : Model
         Model to load.
-    weights : bytes
-        Weights of the model.
+    weights : BinaryIO
+        Stream of the model weights.
+    **kwargs
+        Keyword arguments passed to the model wrapper.
 
     Returns
     -------
@@ -67,18 +75,20 @@ def load_validation_model(model: Model, weights: bytes) -> ModelWrapper:
             model_class = CoffeeLeafOCC
         case _:
             raise ValueError(f"Invalid validation model type: {model.type}")
-    return model_class(model, weights)
+    return model_class(model, weights, **kwargs)
 
 
-def load_processing_model(model: Model, weights: bytes) -> ModelWrapper:
+def load_processing_model(model: Model, weights: BinaryIO, **kwargs) -> ModelWrapper:
     """Load a processing model.
 
     Parameters
     ----------
     model : Model
         Model to load.
-    weights : bytes
-        Weights of the model.
+    weights : BinaryIO
+        Stream of the model weights.
+    **kwargs
+        Keyword arguments passed to the model wrapper.
 
     Returns
     -------
@@ -93,25 +103,27 @@ def load_processing_model(model: Model, weights: bytes) -> ModelWrapper:
             model_class = Segmentation
         case _:
             raise ValueError(f"Invalid processing model type: {model.type}")
-    return model_class(model, weights)
+    return model_class(model, weights, **kwargs)
 
 
-def load_model(model: Model, weights: bytes) -> ModelWrapper:
+def load_model(model: Model, weights: BinaryIO, **kwargs) -> ModelWrapper:
     """Load a model.
 
     Parameters
     ----------
     model : Model
         Model to load.
-    weights : bytes
-        Weights of the model.
+    weights : BinaryIO
+        Stream of the model weights.
+    **kwargs
+        Keyword arguments passed to the model wrapper.
 
     Returns
     -------
     ModelWrapper
         Loaded model.
     """
-    load_function: Callable[[Model, bytes], ModelWrapper]
+    load_function: Callable[..., ModelWrapper]
     match model.category:
         case ModelCategory.VALIDATION:
             load_function = load_validation_model
@@ -119,16 +131,20 @@ def load_model(model: Model, weights: bytes) -> ModelWrapper:
             load_function = load_processing_model
         case _:
             raise ValueError(f"Invalid model category: {model.category}")
-    return load_function(model, weights)
+    return load_function(model, weights, **kwargs)
 
 
 def load_proper_models(
     database: Database,
     storage: Storage,
     running_mode: RunningMode,
-) -> dict[int, ModelWrapper]:
+    capacity: int | None = None,
+    **kwargs,
+) -> ModelRegistry:
     """Load enabled models.
 
+    The weights of the models loaded up front are retrieved concurrently.
+
     Parameters
     ----------
     database : DatabaseInterface
@@ -137,10 +153,14 @@ def load_proper_models(
         Storage interface.
     running_mode : RunningMode
         Running mode.
+    capacity : int | None, optional
+        Maximum number of models loaded at the same time, by default None (unbounded).
+    **kwargs
+        Keyword arguments passed to the model wrappers.
 
     Returns
     -------
-    dict[int, ModelWrapper]
+    ModelRegistry
         Loaded models.
 
     Raises
@@ -148,41 +168,197 @@ def load_proper_models(
     ValueError
         If the model type is invalid.
     """
-    models: dict[int, ModelWrapper] = dict()
+    categories: tuple[ModelCategory, ...]
+    load_function: Callable[..., ModelWrapper]
     enabled_models = database.enabled_models
     match running_mode:
         case RunningMode.VALIDATION:
-            models = {
-                id: load_validation_model(model, storage.retrieve_weights(id))
-                for id, model in enabled_models.items()
-                if model.category == ModelCategory.VALIDATION
-            }
+            categories = (ModelCategory.VALIDATION,)
+            load_function = load_validation_model
         case RunningMode.PROCESSING:
-            models = {
-                id: load_processing_model(model, storage.retrieve_weights(id))
-                for id, model in enabled_models.items()
-                if model.category == ModelCategory.PROCESSING
-            }
+            categories = (ModelCategory.PROCESSING,)
+            load_function = load_processing_model
         case RunningMode.BOTH:
-            models = {
-                id: load_model(model, storage.retrieve_weights(id))
-                for id, model in enabled_models.items()
-                if model.category
-                in (ModelCategory.VALIDATION, ModelCategory.PROCESSING)
-            }
+            categories = (ModelCategory.VALIDATION, ModelCategory.PROCESSING)
+            load_function = load_model
         case _:
             raise ValueError(f"Invalid running mode: {running_mode}")
+
+    model_ids = [
+        id for id, model in enabled_models.items() if model.category in categories
+    ]
+    retrievals: dict[int, Future[BinaryIO]] = dict()
+
+    def load(model_id: int) -> ModelWrapper:
+        if model_id in retrievals:
+            weights = retrievals.pop(model_id).result()
+        else:
+            weights = storage.retrieve_weights(model_id)
+        with weights:
+            return load_function(enabled_models[model_id], weights, **kwargs)
+
+    models = ModelRegistry(model_ids, load, capacity)
+    # The weights of the preloaded models are retrieved concurrently, while
+    # the models whose weights were already retrieved are loaded.
+    preloaded_ids = model_ids[:capacity]
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(storage.concurrent_retrievals, len(preloaded_ids)))
+    ) as executor:
+        for model_id in preloaded_ids:
+            retrievals[model_id] = executor.submit(storage.retrieve_weights, model_id)
+        try:
+            models.preload()
+        finally:
+            for future in retrievals.values():
+                if not future.cancel() and future.exception() is None:
+                    future.result().close()
+            retrievals.clear()
     return models
 
 
+def prefetch(
+    dequeue: Callable[[], QueueElement | None],
+    requeue: Callable[[QueueElement], None],
+    executor: Executor | None = None,
+) -> Generator[QueueElement, None, None]:
+    """Iterate over dequeued elements until the queue is empty.
+
+    Without an executor, each element is dequeued once the previous one has
+    been handled. With one, the next element is dequeued by the executor
+    while the current one is being handled, so the database round trip
+    overlaps with inference. The prefetched element is already claimed: if
+    the iteration stops early it is put back in the queue, but it is lost if
+    the process is killed before then.
+
+    Parameters
+    ----------
+    dequeue : Callable[[], QueueElement | None]
+        Function that dequeues an element, or returns None if the queue is empty.
+    requeue : Callable[[QueueElement], None]
+        Function that puts a dequeued element back in the queue.
+    executor : Executor | None, optional
+        Executor prefetching the next element, by default None (no prefetching).
+
+    Yields
+    ------
+    QueueElement
+        Dequeued element.
+
+    Warns
+    -----
+    RuntimeWarning
+        If the iteration stopped early and the pending dequeue failed.
+    """
+    if executor is None:
+        while (element := dequeue()) is not None:
+            yield element
+        return
+    future = executor.submit(dequeue)
+    try:
+        while (element := future.result()) is not None:
+            future = executor.submit(dequeue)
+            yield element
+    finally:
+        # Waits for the pending dequeue, which returned None if the queue ran
+        # empty. Its error is reported without replacing the one stopping the
+        # iteration, if any.
+        if (error := future.exception()) is None:
+            if (element := future.result()) is not None:
+                requeue(element)
+        elif error is not sys.exception():
+            warnings.warn(
+                f"Could not prefetch a queue element: {error}", RuntimeWarning
+            )
+
+
+def classify_elements(
+    elements: list[QueueElement],
+    model: ModelWrapper,
+    database: Database,
+    storage: Storage,
+):
+    """Classify processing queue elements sharing a model and update their reports.
+
+    Parameters
+    ----------
+    elements : list[QueueElement]
+        Processing queue elements.
+    model : ModelWrapper
+        Classification model of the elements.
+    database : DatabaseInterface
+        Database interface.
+    storage : StorageInterface
+        Storage interface.
+    """
+    classifications = model.batch([element.image for element in elements])
+    database.update_classification_reports(
+        [
+            (element.report_id, disease, severity)
+            for element, (disease, severity) in zip(elements, classifications)
+        ]
+    )
+
+
+def segment_elements(
+    elements: list[QueueElement],
+    model: ModelWrapper,
+    database: Database,
+    storage: Storage,
+):
+    """Segment processing queue elements sharing a model, update their reports and store their masks.
+
+    Parameters
+    ----------
+    elements : list[QueueElement]
+        Processing queue elements.
+    model : ModelWrapper
+        Segmentation model of the elements.
+    database : DatabaseInterface
+        Database interface.
+    storage : StorageInterface
+        Storage interface.
+    """
+    segmentations = model.batch(
+        [element.image for element in elements],
+        [element.generate_mask for element in elements],
+    )
+    database.update_segmentation_reports(
+        [
+            (element.report_id, stress_ratio, severity)
+            for element, (stress_ratio, severity, _) in zip(elements, segmentations)
+        ]
+    )
+    for element, (_, _, mask) in zip(elements, segmentations):
+        if mask is not None:
+            storage.store_mask(mask, element.report_id)
+
+
+# Handlers of the processing queue elements, by report type.
+_PROCESSING_HANDLERS: dict[
+    ProcessingModelType,
+    Callable[[list[QueueElement], ModelWrapper, Database, Storage], None],
+] = {
+    ProcessingModelType.CLASSIFICATION: classify_elements,
+    ProcessingModelType.SEGMENTATION: segment_elements,
+}
+
+
 def consume_processing_queue_elements(
     database: Database,
     queue: Queue,
     storage: Storage,
-    models: dict[int, ModelWrapper],
-):
+    models: Mapping[int, ModelWrapper],
+    batch_size: int = 1,
+    executor: Executor | None = None,
+) -> int:
     """Consume elements from the processing queue and process them.
 
+    Elements are dequeued until the queue is empty, in batches of up to
+    ``batch_size`` elements. The elements of a batch sharing a model are
+    evaluated with a single forward pass and their reports updated with a
+    single statement. If handling a batch fails, the elements of the groups
+    not handled yet are put back in the queue.
+
     Parameters
     ----------
     database : DatabaseInterface
@@ -191,49 +367,70 @@ def consume_processing_queue_elements(
         Queue interface.
     storage : StorageInterface
         Storage interface.
-    models : dict[int, ModelWrapper]
+    models : Mapping[int, ModelWrapper]
         Loaded models.
+    batch_size : int, optional
+        Maximum number of elements processed together, by default 1.
+    executor : Executor | None, optional
+        Executor prefetching the next element, by default None (no prefetching).
+
+    Returns
+    -------
+    int
+        Number of consumed elements.
 
     Raises
     ------
     ValueError
-        If the model type is invalid.
+        If the report type of an element is invalid.
     """
-    while queue.processing_queue_has_elements():
-        element = queue.dequeue_from_processing_queue()
-        if element is None:
-            return
-        model = models[element.model_id]
-        match element.report_type:
-            case ProcessingModelType.CLASSIFICATION:
-                disease, severity = model(element.image)
-                database.update_classification_report(
-                    element.report_id,
-                    disease,
-                    severity,
-                )
-            case ProcessingModelType.SEGMENTATION:
-                stress_ratio, severity, mask = model(
-                    element.image, element.generate_mask
-                )
-                database.update_segmentation_report(
-                    element.report_id,
-                    stress_ratio,
-                    severity,
+    consumed = 0
+    with closing(
+        prefetch(
+            queue.dequeue_from_processing_queue,
+            queue.requeue_to_processing_queue,
+            executor,
+        )
+    ) as dequeued:
+        for batch in batched(dequeued, batch_size):
+            consumed += len(batch)
+            # Elements claimed but not handled yet, put back in the queue if
+            # handling the batch fails.
+            pending = {element.id: element for element in batch}
+            try:
+                groups: dict[tuple[int, ProcessingModelType], list[QueueElement]] = (
+                    dict()
                 )
-                if mask is not None:
-                    storage.store_mask(mask, element.report_id)
-            case _:
-                raise ValueError(f"Invalid model type: {model.__class__.__name__}")
+                for element in batch:
+                    if element.report_type not in _PROCESSING_HANDLERS:
+                        del pending[element.id]
+                        raise ValueError(f"Invalid report type: {element.report_type}")
+                    groups.setdefault(
+                        (element.model_id, element.report_type), []
+                    ).append(element)
+                for (model_id, report_type), group in groups.items():
+                    for element in group:
+                        del pending[element.id]
+                    _PROCESSING_HANDLERS[report_type](
+                        group, models[model_id], database, storage
+                    )
+            except BaseException:
+                for element in pending.values():
+                    queue.requeue_to_processing_queue(element)
+                raise
+    return consumed
 
 
 def consume_validation_queue_elements(
     database: Database,
     queue: Queue,
-    models: dict[int, ModelWrapper],
-):
+    models: Mapping[int, ModelWrapper],
+    executor: Executor | None = None,
+) -> int:
     """Consume elements from the validation queue and validate them.
 
+    Elements are dequeued until the queue is empty.
+
     Parameters
     ----------
     database : DatabaseInterface
@@ -242,61 +439,91 @@ def consume_validation_queue_elements(
         Queue interface.
     storage : StorageInterface
         Storage interface.
-    models : dict[int, ModelWrapper]
+    models : Mapping[int, ModelWrapper]
         Loaded models.
+    executor : Executor | None, optional
+        Executor prefetching the next element, by default None (no prefetching).
+
+    Returns
+    -------
+    int
+        Number of consumed elements.
 
     Raises
     ------
     ValueError
         If the model type is invalid.
     """
-    while queue.validation_queue_has_elements():
-        element = queue.dequeue_from_validation_queue()
-        if element is None:
-            return
-        model = models[element.model_id]
-        validity = bool(model(element.image)[0])
-        queue.update_buffer(element.id, validity)
-        database.update_report_validity(
-            element.report_id, element.report_type, validity
+    consumed = 0
+    with closing(
+        prefetch(
+            queue.dequeue_from_validation_queue,
+            queue.requeue_to_validation_queue,
+            executor,
         )
+    ) as elements:
+        for element in elements:
+            consumed += 1
+            model = models[element.model_id]
+            validity = bool(model(element.image)[0])
+            queue.update_buffer(element.id, validity)
+            database.update_report_validity(
+                element.report_id, element.report_type, validity
+            )
+    return consumed
 
 
 if __name__ == "__main__":
     args = cli()
+    if "compile_cache_dir" in args.settings:
+        # Read by Inductor when the first model is compiled, so compiled
+        # kernels and graphs are reused across restarts.
+        os.environ.setdefault(
+            "TORCHINDUCTOR_CACHE_DIR", args.settings["compile_cache_dir"]
+        )
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
     interface_factory = InterfaceFactory(args.settings)
     database = interface_factory.get_interface(Database)  # type: ignore
     queue = interface_factory.get_interface(Queue)  # type: ignore
     storage = interface_factory.get_interface(Storage)  # type: ignore
     running_mode = RunningMode[args.running_mode.upper()]
-    models = load_proper_models(database, storage, running_mode)
+    models = load_proper_models(
+        database,
+        storage,
+        running_mode,
+        args.settings.get("max_loaded_models"),
+        **args.settings.get("inference", {}),
+    )
     polling_interval = args.settings["polling_interval"]
+    batch_size = args.settings.get("batch_size", 1)
+    # A single thread prefetches the queue elements for the consumer's life.
+    executor = (
+        ThreadPoolExecutor(max_workers=1)
+        if args.settings.get("prefetch", False)
+        else None
+    )
     match running_mode:
         case RunningMode.VALIDATION:
             while True:
-                if not queue.validation_queue_has_elements():
-                    sleep(polling_interval)
-                    continue
-                consume_validation_queue_elements(database, queue, models)
+                if not consume_validation_queue_elements(
+                    database, queue, models, executor
+                ):
+                    queue.wait_for_work(polling_interval, processing=False)
         case RunningMode.PROCESSING:
             while True:
-                if not queue.processing_queue_has_elements():
-                    sleep(polling_interval)
-                    continue
-                consume_processing_queue_elements(database, queue, storage, models)
+                if not consume_processing_queue_elements(
+                    database, queue, storage, models, batch_size, executor
+                ):
+                    queue.wait_for_work(polling_interval, validation=False)
         case RunningMode.BOTH:
             while True:
-                validation_queue_has_elements = queue.validation_queue_has_elements()
-                processing_queue_has_elements = queue.processing_queue_has_elements()
-                if (
-                    not validation_queue_has_elements
-                    and not processing_queue_has_elements
-                ):
-                    sleep(polling_interval)
-                    continue
-                if validation_queue_has_elements:
-                    consume_validation_queue_elements(database, queue, models)
-                if processing_queue_has_elements:
-                    consume_processing_queue_elements(database, queue, storage, models)
+                consumed = consume_validation_queue_elements(
+                    database, queue, models, executor
+                )
+                consumed += consume_processing_queue_elements(
+                    database, queue, storage, models, batch_size, executor
+                )
+                if not consumed:
+                    queue.wait_for_work(polling_interval)
         case _:
             raise ValueError(f"Invalid running mode: {args.running_mode}")
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import hashlib
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from dataclasses import dataclass
 from enum import Enum
+from typing import BinaryIO, ClassVar
 
-from PIL.Image import Image
+import torch
 from torch import Tensor, nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 
 from models.processing import ProcessingModelType
 from models.validation import ValidationModelType
 
+# State dicts of recently loaded weights, by digest of the weights, so models
+# loaded again after eviction, or sharing their weights, skip deserialization.
+_state_dicts: OrderedDict[bytes, dict[str, Tensor]] = OrderedDict()
+_STATE_DICTS_CAPACITY = 4
+_DIGEST_CHUNK_SIZE = 1 << 20
+
 
 class ModelCategory(Enum):
     """Model category enumeration.
@@ -74,19 +84,87 @@ class ModelBase(ABC, nn.Module):
         PyTorch neural network module.
     """
 
+    input_size: ClassVar[tuple[int, int]]
+    """Height and width of the images produced by transform."""
+    weights_digest: bytes
+    """Digest of the loaded weights."""
+
     @classmethod
     @abstractmethod
-    def transform(cls, image: Image) -> Tensor:
+    def transform(cls, image: Tensor) -> Tensor:
         """Transform an image into a tensor.
 
         Parameters
         ----------
-        image : Image
-            The image to transform.
+        image : Tensor
+            The RGB image to transform, as a uint8 tensor with shape (3, H, W).
 
         Returns
         -------
         Tensor
-            The transformed image.
+            The transformed image, with shape (3, *input_size).
         """
         pass
+
+    def fuse_batch_norms(self):
+        """Fold the batch normalizations into the convolutions they follow.
+
+        A convolution is followed by a batch normalization when both are
+        consecutive in a Sequential, or when they are children of the same
+        module named convN and bnN, as in the ResNet blocks. The folded
+        convolution replaces the convolution, with new tensors, and the batch
+        normalization is replaced with an identity. The model must be in eval
+        mode, as the running statistics are folded.
+        """
+        for module in list(self.modules()):
+            children = dict(module.named_children())
+            if isinstance(module, nn.Sequential):
+                pairs = list(zip(children, list(children)[1:]))
+            else:
+                pairs = [
+                    (name, "bn" + name.removeprefix("conv"))
+                    for name in children
+                    if name.startswith("conv")
+                ]
+            for conv_name, bn_name in pairs:
+                conv, bn = children[conv_name], children.get(bn_name)
+                if isinstance(conv, nn.Conv2d) and isinstance(bn, nn.BatchNorm2d):
+                    setattr(module, conv_name, fuse_conv_bn_eval(conv, bn))
+                    setattr(module, bn_name, nn.Identity())
+
+    def _load_weights(self, weights: BinaryIO):
+        """Load the model weights, reusing the state dicts of recently loaded weights.
+
+        Only tensors and plain containers are unpickled from the weights, and
+        the tensors of weights in named files are memory mapped from them. The
+        parameters are assigned the loaded tensors, so the model can be
+        built on the meta device, without allocating or initializing them.
+        The tensors are shared with the cache and the models loading the same
+        weights, so they must not be modified in place.
+
+        Parameters
+        ----------
+        weights : BinaryIO
+            Seekable stream of the model weights.
+        """
+        hasher = hashlib.blake2b()
+        while chunk := weights.read(_DIGEST_CHUNK_SIZE):
+            hasher.update(chunk)
+        digest = hasher.digest()
+        self.weights_digest = digest
+        if digest in _state_dicts:
+            _state_dicts.move_to_end(digest)
+        else:
+            weights.seek(0)
+            # Weights read from a named file, such as the storage cache, are
+            # memory mapped instead of read into memory.
+            name = getattr(weights, "name", None)
+            _state_dicts[digest] = torch.load(
+                name if isinstance(name, str) else weights,
+                map_location="cpu",
+                weights_only=True,
+                mmap=isinstance(name, str),
+            )
+            if len(_state_dicts) > _STATE_DICTS_CAPACITY:
+                _state_dicts.popitem(last=False)
+        self.load_state_dict(_state_dicts[digest], assign=True)
@@ -1,9 +1,8 @@
-import io
+from typing import BinaryIO
 
 import torch
-from PIL.Image import Image
 from torch import Tensor
-from torchvision import transforms
+from torchvision.transforms import v2 as transforms
 
 from .... import ModelBase
 from . import Bottleneck, ResNet
@@ -25,38 +24,35 @@ class ResNet50(ResNet, ModelBase):
         The transformed image.
     """
 
+    input_size = (224, 224)
     _transform = transforms.Compose(
         [
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
+            transforms.Resize(input_size),
+            transforms.ToDtype(torch.float32, scale=True),
             transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-            transforms.Lambda(lambda x: x.unsqueeze(0)),
-            transforms.Lambda(lambda x: x.cuda()),
         ]
     )
 
-    def __init__(self, weights: bytes):
+    def __init__(self, weights: BinaryIO):
         """Initialize the model.
 
         Parameters
         ----------
-        weights : bytes
-            Weights of the model.
+        weights : BinaryIO
+            Stream of the model weights.
         """
-        super(ResNet50, self).__init__(Bottleneck, [3, 4, 6, 3])
-        buffer = io.BytesIO(weights)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        state_dict = torch.load(buffer, map_location=device)
-        self.load_state_dict(state_dict)
+        with torch.device("meta"):
+            super(ResNet50, self).__init__(Bottleneck, [3, 4, 6, 3])
+        self._load_weights(weights)
 
     @classmethod
-    def transform(cls, image: Image) -> Tensor:
+    def transform(cls, image: Tensor) -> Tensor:
         """Transform an image array to a tensor to be used as input to the model.
 
         Parameters
         ----------
-        image_array : Image
-            The image array.
+        image : Tensor
+            The RGB image as a uint8 tensor with shape (3, H, W).
 
         Returns
         -------
@@ -1,15 +1,18 @@
-import io
+from collections import OrderedDict
+from typing import BinaryIO
 
-import cv2
-import numpy as np
 import torch
-from PIL.Image import Image
 from torch import Tensor, nn
 from torch.nn import functional as F
+from torchvision.transforms.v2.functional import resize
 
 from .... import ModelBase
 from . import Bottleneck, ResNet
 
+# Number of concatenation buffers kept by each pyramid pooling module, one per
+# input shape.
+_PRIORS_BUFFERS_CAPACITY = 16
+
 
 class PSPModule(nn.Module):
     def __init__(self, features, out_features=1024, sizes=(1, 2, 3, 6)):
@@ -22,6 +25,45 @@ class PSPModule(nn.Module):
             features * (len(sizes) + 1), out_features, kernel_size=1
         )
         self.relu = nn.ReLU()
+        self._priors_buffers: OrderedDict[tuple, Tensor] = OrderedDict()
+
+    def _priors_buffer(self, feats, channels):
+        """Get the buffer the priors of an input are concatenated into.
+
+        Buffers are allocated on first use and reused by later inputs with
+        the same shape, type, device and memory format.
+
+        Parameters
+        ----------
+        feats : Tensor
+            The input features.
+        channels : int
+            Number of channels of the concatenated priors.
+
+        Returns
+        -------
+        Tensor
+            The buffer.
+        """
+        memory_format = (
+            torch.channels_last
+            if feats.is_contiguous(memory_format=torch.channels_last)
+            else torch.contiguous_format
+        )
+        shape = (feats.size(0), channels, feats.size(2), feats.size(3))
+        key = (shape, feats.dtype, feats.device, memory_format)
+        if key in self._priors_buffers:
+            self._priors_buffers.move_to_end(key)
+        else:
+            self._priors_buffers[key] = torch.empty(
+                shape,
+                dtype=feats.dtype,
+                device=feats.device,
+                memory_format=memory_format,
+            )
+            if len(self._priors_buffers) > _PRIORS_BUFFERS_CAPACITY:
+                self._priors_buffers.popitem(last=False)
+        return self._priors_buffers[key]
 
     def _make_stage(self, features, size):
         prior = nn.AdaptiveAvgPool2d(output_size=(size, size))
@@ -34,7 +76,19 @@ class PSPModule(nn.Module):
             F.interpolate(input=stage(feats), size=(h, w), mode="bilinear")
             for stage in self.stages
         ] + [feats]
-        bottle = self.bottleneck(torch.cat(priors, 1))
+        # Scripted and compiled graphs plan their own memory, and the memory
+        # used while capturing a CUDA graph must outlive the graph, so none of
+        # them reuses the buffers.
+        if (
+            torch.jit.is_scripting()
+            or torch.compiler.is_compiling()
+            or (feats.is_cuda and torch.cuda.is_current_stream_capturing())
+        ):
+            cat = torch.cat(priors, 1)
+        else:
+            channels = sum(prior.size(1) for prior in priors)
+            cat = torch.cat(priors, 1, out=self._priors_buffer(feats, channels))
+        bottle = self.bottleneck(cat)
         return self.relu(bottle)
 
 
@@ -67,39 +121,45 @@ class PSPNet(ModelBase):
         The transformed image.
     """
 
+    input_size = (256, 512)
+
     def __init__(
         self,
-        weights: bytes,
+        weights: BinaryIO,
     ):
         """Initialize the model.
 
         Parameters
         ----------
-        weights : bytes
-            Weights of the model.
+        weights : BinaryIO
+            Stream of the model weights.
         """
         n_classes = 3
         sizes = (1, 2, 3, 6)
         psp_size = 2048
         deep_features_size = 1024
         super().__init__()
-        self.feats = ResNet(Bottleneck, [3, 4, 6, 3])
-        self.psp = PSPModule(psp_size, 1024, sizes)
-        self.drop_1 = nn.Dropout2d(p=0.3)
-        self.up_1 = PSPUpsample(1024, 256)
-        self.up_2 = PSPUpsample(256, 64)
-        self.up_3 = PSPUpsample(64, 64)
-        self.drop_2 = nn.Dropout2d(p=0.15)
-        self.final = nn.Sequential(
-            nn.Conv2d(64, n_classes, kernel_size=1), nn.LogSoftmax()
-        )
-        self.classifier = nn.Sequential(
-            nn.Linear(deep_features_size, 256), nn.ReLU(), nn.Linear(256, n_classes)
-        )
-        buffer = io.BytesIO(weights)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        state_dict = torch.load(buffer, map_location=device)
-        self.load_state_dict(state_dict)
+        with torch.device("meta"):
+            self.feats = ResNet(Bottleneck, [3, 4, 6, 3])
+            self.psp = PSPModule(psp_size, 1024, sizes)
+            self.drop_1 = nn.Dropout2d(p=0.3)
+            self.up_1 = PSPUpsample(1024, 256)
+            self.up_2 = PSPUpsample(256, 64)
+            self.up_3 = PSPUpsample(64, 64)
+            self.drop_2 = nn.Dropout2d(p=0.15)
+            # Raw logits: the pixel classes only need their argmax, and
+            # wrappers needing log probabilities apply log_softmax on demand.
+            self.final = nn.Sequential(nn.Conv2d(64, n_classes, kernel_size=1))
+            self.classifier = nn.Sequential(
+                nn.Linear(deep_features_size, 256), nn.ReLU(), nn.Linear(256, n_classes)
+            )
+        self._load_weights(weights)
+        # The weights expect BGR images. Reversing the input channels of the
+        # first convolution lets it take the RGB images as they are decoded,
+        # so transform skips a full copy of every image. The loaded tensor is
+        # shared, so the flipped weight is a new one.
+        conv1 = self.feats.conv1
+        conv1.weight = nn.Parameter(conv1.weight.flip(1))
 
     def forward(self, x):
         f, class_f = self.feats(x)
@@ -117,25 +177,20 @@ class PSPNet(ModelBase):
         return self.final(p), self.classifier(auxiliary)
 
     @classmethod
-    def transform(cls, image: Image) -> Tensor:
+    def transform(cls, image: Tensor) -> Tensor:
         """Transform an image array to a tensor to be used as input to the model.
 
         Parameters
         ----------
-        image_array : Image
-            The image array.
+        image : Tensor
+            The RGB image as a uint8 tensor with shape (3, H, W).
 
         Returns
         -------
         Tensor
             The image tensor to be used as input to the model.
         """
-        image_array = np.array(image, dtype=np.uint8)
-        transformed_image = cv2.resize(image_array, (512, 256))
-        transformed_image = transformed_image[:, :, ::-1]
-        transformed_image = transformed_image.astype(np.float64)
-        transformed_image = transformed_image.astype(float) / 255.0
-        transformed_image = transformed_image.transpose(2, 0, 1)
-        tensor = torch.from_numpy(transformed_image).float()
-        tensor = tensor.unsqueeze(0).cuda()
-        return tensor
+        # Resized in uint8 before the float conversion, which is then scaled in
+        # place. The channels stay in RGB order, see __init__.
+        transformed_image = resize(image, list(cls.input_size), antialias=False)
+        return transformed_image.float().div_(255.0)
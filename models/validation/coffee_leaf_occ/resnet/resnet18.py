@@ -1,7 +1,7 @@
-import io
+from typing import BinaryIO
 
 import torch
-import torchvision.transforms as transforms
+from torchvision.transforms import v2 as transforms
 from torch import Tensor, nn
 from torchvision.models.resnet import BasicBlock
 
@@ -25,25 +25,22 @@ class ResNet18(ResNet, ModelBase):
         The transformed image.
     """
 
+    input_size = (224, 224)
     _transform = transforms.Compose(
         [
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
+            transforms.Resize(input_size),
+            transforms.ToDtype(torch.float32, scale=True),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            transforms.Lambda(lambda x: x.unsqueeze(0)),
-            transforms.Lambda(lambda x: x.cuda()),
         ]
     )
 
-    def __init__(self, weights: bytes):
-        super().__init__(BasicBlock, [2, 2, 2, 2])
-        num_features = self.fc.in_features  # type: ignore
-        self.fc = nn.Linear(num_features, 2)
-        buffer = io.BytesIO(weights)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        state_dict = torch.load(buffer, map_location=device)
-        self.load_state_dict(state_dict)
+    def __init__(self, weights: BinaryIO):
+        with torch.device("meta"):
+            super().__init__(BasicBlock, [2, 2, 2, 2])
+            num_features = self.fc.in_features  # type: ignore
+            self.fc = nn.Linear(num_features, 2)
+        self._load_weights(weights)
 
     @classmethod
-    def transform(cls, image) -> Tensor:
+    def transform(cls, image: Tensor) -> Tensor:
         return cls._transform(image)